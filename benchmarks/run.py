@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import write_inputs
+from helpers.cache import PARSED_FRAMES
+from helpers.conversion_cache import CONVERTED
+from helpers.exporter import write_xlsx
+from helpers.file_handler import FileHandler
+from templates.PaymentStatementTemplate import PaymentStatementTemplate
+from templates.SaleOrderTemplate import SaleOrderTemplate
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baselines.json")
+
+TEMPLATES = {
+    "sale_order": (
+        SaleOrderTemplate,
+        (
+            ("Amazon Sale Order Template", SaleOrderTemplate.REQUIRED_AMAZON_COLUMNS),
+            ("CP Item List", SaleOrderTemplate.REQUIRED_CP_COLUMNS),
+            ("Product Bundle", SaleOrderTemplate.REQUIRED_BUNDLE_COLUMNS),
+        ),
+        {},
+    ),
+    "payment_statement": (
+        PaymentStatementTemplate,
+        (
+            ("Payment Statement", PaymentStatementTemplate.REQUIRED_PAYMENT_COLUMNS),
+            ("Sale Register", PaymentStatementTemplate.REQUIRED_SALE_REGISTER_COLUMNS),
+            ("Matching Template", PaymentStatementTemplate.REQUIRED_MATCHING_TEMPLATE_COLUMNS),
+        ),
+        {"order_type": "COD_", "expense": "Promo rebates,Product tax discount"},
+    ),
+}
+
+
+def timed(function):
+    start = time.perf_counter()
+    value = function()
+    return time.perf_counter() - start, value
+
+
+def validate_files(paths, required):
+    for path, (file_name, columns) in zip(paths, required):
+        FileHandler.validate_header([column.strip() for column in FileHandler.read_header(path)], columns, file_name)
+
+
+def run_case(kind, rows, data_dir, seed, repeat):
+    template_class, required, process_kwargs = TEMPLATES[kind]
+    paths = write_inputs(kind, rows, data_dir, seed)
+
+    # Best of `repeat` runs per stage; the parse cache is cleared and the
+    # conversion cache moved to an empty directory so every read stage parses
+    # the files again. The cached read then comes from the converted files.
+    timings = {}
+    for attempt in range(repeat):
+        PARSED_FRAMES.clear()
+        if CONVERTED is not None:
+            CONVERTED.directory = os.path.join(data_dir, f"converted_{rows}_{attempt}")
+        stages = {}
+        stages["validate"], _ = timed(lambda: validate_files(paths, required))
+        stages["read"], template = timed(lambda: template_class(*paths))
+        if CONVERTED is not None:
+            PARSED_FRAMES.clear()
+            stages["cached read"], _ = timed(lambda: template_class(*paths))
+        stages["process"], (output_df, error_df) = timed(lambda: template.process(**process_kwargs))
+        stages["export"], _ = timed(lambda: write_xlsx([("Output", output_df), ("Errors", error_df)]))
+        for stage, seconds in stages.items():
+            timings[stage] = min(seconds, timings.get(stage, seconds))
+    return timings
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)["timings"]
+
+
+def save_baselines(path, timings):
+    with open(path, "w") as file:
+        json.dump({"machine": platform.node(), "python": platform.python_version(), "timings": timings}, file, indent=2, sort_keys=True)
+
+
+def is_regression(seconds, baseline, tolerance, noise_floor):
+    return baseline is not None and seconds > baseline * (1 + tolerance) and seconds - baseline > noise_floor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time reading, validation, processing and export of both templates.")
+    parser.add_argument("--template", choices=sorted(TEMPLATES), action="append")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma separated transactional row counts, 1000 to 1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="Where the generated inputs are written (a temporary directory by default)")
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown over the baseline, as a fraction")
+    parser.add_argument("--noise-floor", type=float, default=0.05, help="Slowdowns below this many seconds are ignored")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    baselines = load_baselines(args.baseline)
+    timings = {}
+    regressions = []
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        data_dir = args.data_dir or temp_dir
+        print(f"{'case':<40}{'seconds':>10}{'baseline':>10}{'rows/s':>12}")
+        for kind in args.template or sorted(TEMPLATES):
+            for rows in sizes:
+                for stage, seconds in run_case(kind, rows, data_dir, args.seed, args.repeat).items():
+                    case = f"{kind}/{rows}/{stage}"
+                    timings[case] = seconds
+                    baseline = baselines.get(case)
+                    flag = ""
+                    if is_regression(seconds, baseline, args.tolerance, args.noise_floor):
+                        regressions.append(case)
+                        flag = "  REGRESSION"
+                    baseline_text = f"{baseline:.3f}" if baseline is not None else "-"
+                    print(f"{case:<40}{seconds:>10.3f}{baseline_text:>10}{rows / seconds:>12,.0f}{flag}")
+
+    if args.update_baseline:
+        save_baselines(args.baseline, {**baselines, **timings})
+        print(f"Baselines written to {args.baseline}")
+
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
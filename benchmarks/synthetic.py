@@ -0,0 +1,209 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from helpers.exporter import write_xlsx
+
+STATES = [
+    "Maharashtra", "Karnataka", "Tamil Nadu", "Gujarat", "Delhi", "Uttar Pradesh",
+    "West Bengal", "Telangana", "Kerala", "Rajasthan", "Andhra Pradesh", "Haryana",
+]
+
+STATEMENT_LINES = [
+    # (amount-description, amount-type, share of orders with the line, amount range)
+    ("Principal", "ItemPrice", 1.0, (99, 4999)),
+    ("Principal", "ItemPrice", 0.25, (99, 2999)),
+    ("Shipping", "ItemPrice", 0.3, (40, 150)),
+    ("Commission", "ItemFees", 1.0, (-400, -10)),
+    ("FBA Weight Handling Fee", "ItemFees", 0.6, (-120, -25)),
+    ("TCS-IGST", "ItemWithheldTax", 0.9, (-50, -1)),
+    ("Promo rebates", "Promotion", 0.2, (-200, -10)),
+    ("Product tax discount", "ItemPrice", 0.1, (-30, -1)),
+]
+
+MATCHING_ACCOUNTS = {
+    "Principal": ("Debtors (INR) - TMPL", "Debtors (INR) - TMPL29"),
+    "Shipping": ("Debtors (INR) - TMPL", "Debtors (INR) - TMPL29"),
+    "Commission": ("Amazon Commission - TMPL", "Amazon Commission - TMPL29"),
+    "FBA Weight Handling Fee": ("Amazon Shipping Charges - TMPL", "Amazon Shipping Charges - TMPL29"),
+    "TCS-IGST": ("TCS Receivable - TMPL", "TCS Receivable - TMPL29"),
+    "Promo rebates": ("Creditors (INR) - TMPL", "Creditors (INR) - TMPL29"),
+    "Product tax discount": ("Creditors (INR) - TMPL", "Creditors (INR) - TMPL29"),
+    "Cost of Advertising": ("Advertisement Expenses - TMPL", "Advertisement Expenses - TMPL29"),
+    "Amazon Business Advisory Fee": ("Professional Fees - TMPL", "Professional Fees - TMPL29"),
+}
+
+SETTLEMENT_START = pd.Timestamp(2024, 1, 1)
+SETTLEMENT_DAYS = 14
+
+
+def amounts(rng, low, high, size):
+    return np.round(rng.uniform(low, high, size), 2)
+
+
+def order_ids(numbers, rng):
+    suffixes = rng.integers(0, 10 ** 7, len(numbers))
+    return [f"{171 + number % 37:03d}-{number:07d}-{suffix:07d}" for number, suffix in zip(numbers, suffixes)]
+
+
+def state_names(rng, size):
+    # Real reports mix casing and stray whitespace, and miss the state now and then.
+    states = np.array(STATES + ["maharashtra ", "KARNATAKA", " tamil nadu", ""], dtype=object)
+    names = states[rng.integers(0, len(states), size)]
+    names[rng.random(size) < 0.005] = np.nan
+    return names
+
+
+def sale_order_inputs(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    item_count = int(np.clip(rows // 20, 200, 20000))
+
+    asins = np.array([f"B0{number:08X}" for number in range(item_count)], dtype=object)
+    item_codes = np.array([f"TMPL-{number:06d}" for number in range(item_count)], dtype=object)
+    listed = rng.random(item_count) < 0.97
+    cp_df = pd.DataFrame({"Amazon ASIN": asins[listed], "Item Code": item_codes[listed]})
+
+    bundled = np.flatnonzero(rng.random(item_count) < 0.95)
+    components = np.where(rng.random(len(bundled)) < 0.1, 2, 1)
+    bundle_ids = np.repeat(item_codes[bundled], components)
+    packs = rng.integers(1, 7, len(bundle_ids))
+    quantities = packs.copy()
+    quantities[rng.random(len(quantities)) < 0.005] = 0
+    bundle_df = pd.DataFrame({
+        "ID": bundle_ids,
+        "Item (Product Bundle Item)": [f"{code} - Item (Pack of {pack})" for code, pack in zip(bundle_ids, packs)],
+        "Qty (Product Bundle Item)": quantities,
+    })
+
+    order_numbers = np.sort(rng.integers(0, max(int(rows / 1.3), 1), rows))
+    order_id_map = dict(zip(np.unique(order_numbers), order_ids(np.unique(order_numbers), rng)))
+    asin_index = rng.integers(0, item_count, rows)
+    order_asins = asins[asin_index]
+    unknown = rng.random(rows) < 0.02
+    order_asins[unknown] = [f"B1{number:08X}" for number in rng.integers(0, 10 ** 8, unknown.sum())]
+    quantity = rng.choice([1, 1, 1, 1, 2, 2, 3], rows)
+    purchased = SETTLEMENT_START + pd.to_timedelta(rng.integers(0, 30 * 86400, rows), unit="s")
+
+    amazon_df = pd.DataFrame({
+        "amazon-order-id": [order_id_map[number] for number in order_numbers],
+        "purchase-date": purchased.strftime("%Y-%m-%dT%H:%M:%S+00:00"),
+        "fulfillment-channel": np.where(rng.random(rows) < 0.7, "Amazon", "Merchant"),
+        "asin": order_asins,
+        "quantity": quantity,
+        "item-price": np.round(amounts(rng, 99, 4999, rows) * quantity, 2),
+        "ship-state": state_names(rng, rows),
+    })
+    return amazon_df, cp_df, bundle_df
+
+
+def payment_statement_inputs(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    lines_per_order = sum(share for _, _, share, _ in STATEMENT_LINES)
+    order_count = max(int(rows / lines_per_order), 1)
+
+    present = np.column_stack([rng.random(order_count) < share for _, _, share, _ in STATEMENT_LINES])
+    order_index, line_index = np.nonzero(present)
+    ids = np.array(order_ids(np.arange(order_count), rng), dtype=object)
+    order_days = rng.integers(0, SETTLEMENT_DAYS, order_count)
+
+    line_amounts = np.empty(len(line_index))
+    for line, (_, _, _, (low, high)) in enumerate(STATEMENT_LINES):
+        selected = line_index == line
+        line_amounts[selected] = amounts(rng, low, high, selected.sum())
+
+    order_lines = pd.DataFrame({
+        "order-id": ids[order_index],
+        "amount": line_amounts,
+        "posted-date": posted_dates(order_days[order_index]),
+        "amount-description": np.array([description for description, _, _, _ in STATEMENT_LINES], dtype=object)[line_index],
+        "amount-type": np.array([kind for _, kind, _, _ in STATEMENT_LINES], dtype=object)[line_index],
+    })
+
+    null_count = max(order_count // 200, 2)
+    null_types = np.array(["Cost of Advertising", "Amazon Business Advisory Fee"], dtype=object)[rng.integers(0, 2, null_count)]
+    null_lines = pd.DataFrame({
+        "order-id": np.nan,
+        "amount": amounts(rng, -900, -10, null_count),
+        "posted-date": posted_dates(rng.integers(0, SETTLEMENT_DAYS, null_count)),
+        "amount-description": null_types,
+        "amount-type": null_types,
+    })
+    reserve_lines = pd.DataFrame({
+        "order-id": np.nan,
+        "amount": [-round(order_count * 3.5, 2), round(order_count * 3.1, 2)],
+        "posted-date": posted_dates([SETTLEMENT_DAYS - 1, 0]),
+        "amount-description": ["Current Reserve Amount", "Previous Reserve Amount Balance"],
+        "amount-type": "other-transaction",
+    })
+
+    body = pd.concat([order_lines, null_lines, reserve_lines], ignore_index=True)
+    body = body.iloc[rng.permutation(len(body))]
+    header = pd.DataFrame({
+        "settlement-start-date": [SETTLEMENT_START.strftime("%d.%m.%Y %H:%M:%S UTC")],
+        "settlement-end-date": [(SETTLEMENT_START + pd.Timedelta(days=SETTLEMENT_DAYS)).strftime("%d.%m.%Y %H:%M:%S UTC")],
+        "amount": [round(float(body["amount"].sum()), 2)],
+    })
+    statement = pd.concat([header, body], ignore_index=True)[
+        ["settlement-start-date", "settlement-end-date", "order-id", "amount", "posted-date", "amount-description", "amount-type"]
+    ]
+
+    registered = np.flatnonzero(rng.random(order_count) < 0.98)
+    states = rng.integers(0, 2, len(registered))
+    sale_register = pd.DataFrame({
+        "Customer's Purchase Order": ids[registered],
+        "Company GSTIN": np.where(states == 0, "27AACCT1557E1ZH", "29AACCT1557E1ZJ"),
+        "Customer Name": [f"Amazon Sales ({state})" for state in np.array(STATES)[rng.integers(0, len(STATES), len(registered))]],
+        "Voucher": [f"SINV-24-{number:07d}" for number in registered],
+        "Voucher Type": "Sales Invoice",
+        "Posting Date": SETTLEMENT_START + pd.to_timedelta(order_days[registered], unit="D"),
+        "Cost Center": "6 - Retail - TMPL",
+        "Company": np.where(states == 0, "Thakker Mercantile Private Limited", "Thakker Mercantile Private Limited - 29"),
+    })
+
+    matching_template = pd.DataFrame(
+        [(description, erp27, erp29) for description, (erp27, erp29) in MATCHING_ACCOUNTS.items()],
+        columns=["amount-description", "ERP 27 Company", "ERP 29 Company"],
+    )
+    return statement, sale_register, matching_template
+
+
+def posted_dates(days):
+    return (SETTLEMENT_START + pd.to_timedelta(np.asarray(days), unit="D")).strftime("%d.%m.%Y")
+
+
+GENERATORS = {
+    "sale_order": (sale_order_inputs, ("amazon_orders", "cp_items", "product_bundles")),
+    "payment_statement": (payment_statement_inputs, ("payment_statement", "sale_register", "matching_template")),
+}
+
+
+def write_inputs(kind, rows, directory, seed=0):
+    generate, names = GENERATORS[kind]
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, df in zip(names, generate(rows, seed)):
+        path = os.path.join(directory, f"{name}_{rows}.xlsx")
+        with open(path, "wb") as file:
+            file.write(write_xlsx([("Sheet1", df)]))
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic template inputs as xlsx files.")
+    parser.add_argument("--kind", choices=sorted(GENERATORS), action="append")
+    parser.add_argument("--rows", type=int, action="append", help="Transactional rows, 1000 to 1000000")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output-dir", default="synthetic")
+    args = parser.parse_args(argv)
+
+    for kind in args.kind or sorted(GENERATORS):
+        for rows in args.rows or [1000]:
+            for path in write_inputs(kind, rows, args.output_dir, args.seed):
+                print(path)
+
+
+if __name__ == "__main__":
+    main()
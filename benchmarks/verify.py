@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+import tempfile
+
+from benchmarks.run import TEMPLATES
+from benchmarks.synthetic import write_inputs
+from helpers.verify import MAX_DIFFERENCES, MONEY_TOLERANCE, verify
+
+DEFAULT_SIZES = [1000, 10000]
+
+
+def verify_case(kind, rows, data_dir, seed=0, candidate=None, reference="legacy", tolerance=MONEY_TOLERANCE,
+                limit=MAX_DIFFERENCES):
+    # One synthetic corpus through both engines, read from xlsx the way the
+    # pages and the CLI read their files.
+    template_class, _, process_kwargs = TEMPLATES[kind]
+    template = template_class(*write_inputs(kind, rows, data_dir, seed))
+    return verify(
+        template, process_kwargs, reference, candidate, tolerance, limit, name=f"{kind}/{rows}/seed {seed}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the legacy and optimized engines on synthetic inputs and compare them.")
+    parser.add_argument("--template", choices=sorted(TEMPLATES), action="append")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma separated transactional row counts")
+    parser.add_argument("--seeds", default="0", help="Comma separated generator seeds")
+    parser.add_argument("--candidate", help="Engine checked against the reference (each template's default)")
+    parser.add_argument("--reference", default="legacy")
+    parser.add_argument("--tolerance", type=float, default=MONEY_TOLERANCE, help="Allowed difference of money cells")
+    parser.add_argument("--limit", type=int, default=MAX_DIFFERENCES, help="Differences shown per frame")
+    parser.add_argument("--json", action="store_true", help="One JSON line per case instead of the text report")
+    args = parser.parse_args(argv)
+
+    failed = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for kind in args.template or sorted(TEMPLATES):
+            for rows in (int(size) for size in args.sizes.split(",")):
+                for seed in (int(seed) for seed in args.seeds.split(",")):
+                    result = verify_case(
+                        kind, rows, data_dir, seed, args.candidate, args.reference, args.tolerance, args.limit
+                    )
+                    print(json.dumps(result.to_dict()) if args.json else result.report())
+                    if not result.ok:
+                        failed.append(result.name)
+
+    if failed:
+        print(f"{len(failed)} case(s) differ: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
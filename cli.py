@@ -0,0 +1,122 @@
+import argparse
+import logging
+import os
+import sys
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from helpers.batch import expand_inputs, run_batch
+from helpers.reference_store import ReferenceStore
+from templates.PaymentStatementTemplate import PaymentStatementTemplate
+from templates.SaleOrderTemplate import SaleOrderTemplate
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Amazon reports without the Streamlit pages.")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("inputs", nargs="+", help="Input files, directories or glob patterns")
+    common.add_argument("--output-dir", default="output")
+    common.add_argument("--concat", action="store_true", help="Write one output and one error file for all inputs")
+    common.add_argument("--workers", type=int, default=os.cpu_count())
+    common.add_argument("--format", dest="export_format", choices=["xlsx", "csv"], default="xlsx")
+    common.add_argument("--trace", action="store_true", help="Write per-order totals next to each output")
+    common.add_argument("--ledger", help="SQLite ledger of processed orders: rows already in it are skipped, new ones recorded")
+    common.add_argument("--reference-store", help="SQLite reference store: given reference files are stored, missing ones loaded from it")
+    common.add_argument(
+        "--shadow", action="store_true", help="also run the legacy engine and log where its output differs (slow)"
+    )
+    common.add_argument("--log-level", default="WARNING", help="INFO logs the run stats of every job as JSON")
+
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sale_order = commands.add_parser("sale-order", parents=[common], help="Amazon sale order reports")
+    sale_order.add_argument("--cp-items")
+    sale_order.add_argument("--bundles")
+    sale_order.add_argument("--engine", choices=SaleOrderTemplate.ENGINES, default="vectorized")
+    sale_order.add_argument(
+        "--pack-sizes", action="store_true", help="divide stock UOM rates by the '(Pack of N)' in the item name"
+    )
+
+    payment = commands.add_parser("payment-statement", parents=[common], help="Amazon payment statements")
+    payment.add_argument("--sale-register", required=True)
+    payment.add_argument("--matching-template")
+    payment.add_argument("--order-type", choices=["COD_", "Electronic_"], required=True)
+    payment.add_argument("--expense", default="Promo rebates,Product tax discount")
+    payment.add_argument("--engine", choices=PaymentStatementTemplate.ENGINES, default="groupby")
+    payment.add_argument(
+        "--stream", action="store_true", help="write journal and error rows to the files as they are produced"
+    )
+
+    args = parser.parse_args(argv)
+    stored = ("cp_items", "bundles") if args.command == "sale-order" else ("matching_template",)
+    missing = [name for name in stored if getattr(args, name) is None]
+    if missing and not args.reference_store:
+        parser.error(f"{', '.join('--' + name.replace('_', '-') for name in missing)} required without --reference-store")
+    if getattr(args, "stream", False) and (args.concat or args.engine != "groupby" or args.shadow):
+        parser.error("--stream works with the groupby engine and without --concat or --shadow")
+    return args
+
+
+def report(result):
+    if result.error:
+        print(f"{result.name}: failed: {result.error}")
+    else:
+        print(
+            f"{result.name}: {result.rows} rows in {result.seconds:.2f}s "
+            f"({result.rows_per_second:,.0f} rows/s), {result.output_rows} output, {result.error_rows} errors"
+        )
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    if args.command == "sale-order":
+        template_class = SaleOrderTemplate
+        reference_files = (args.cp_items, args.bundles)
+        process_kwargs = {"engine": args.engine, "pack_sizes": args.pack_sizes}
+    else:
+        template_class = PaymentStatementTemplate
+        reference_files = (args.sale_register, args.matching_template)
+        process_kwargs = {"order_type": args.order_type, "expense": args.expense, "engine": args.engine}
+
+    if args.reference_store:
+        stored_files = reference_files[len(reference_files) - len(template_class.STORED_REFERENCES):]
+        versions = ReferenceStore(args.reference_store).resolve(template_class.STORED_REFERENCES, stored_files)
+        missing = [name for name, version in zip(template_class.STORED_REFERENCES, versions) if version is None]
+        if missing:
+            print(f"Not in the reference store, pass the file: {', '.join(missing)}")
+            return 1
+
+    inputs = expand_inputs(args.inputs)
+    if not inputs:
+        print("No input files found")
+        return 1
+
+    start = time.perf_counter()
+    try:
+        results = run_batch(
+            template_class, reference_files, inputs, process_kwargs, args.output_dir,
+            args.export_format, args.concat, args.workers, on_result=report, trace=args.trace,
+            ledger_path=args.ledger, store_path=args.reference_store, stream=getattr(args, "stream", False),
+            shadow=args.shadow,
+        )
+    except ValueError as e:
+        print(e)
+        return 1
+    except BrokenProcessPool:
+        print("A batch worker process failed; its error is logged above")
+        return 1
+    seconds = time.perf_counter() - start
+
+    rows = sum(result.rows for result in results)
+    failed = sum(1 for result in results if result.error)
+    print(
+        f"{len(results) - failed}/{len(results)} files, {rows} rows in {seconds:.2f}s "
+        f"({rows / seconds if seconds else 0:,.0f} rows/s)"
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
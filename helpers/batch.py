@@ -0,0 +1,355 @@
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from helpers import file_handler
+from helpers.exporter import open_sink, write_csv, write_xlsx
+from helpers.instrumentation import RunStats, count
+from helpers.ledger import ProcessedLedger
+from helpers.reference_store import ReferenceStore
+from helpers.verify import verify
+
+INPUT_EXTENSIONS = (".xlsx", ".xls")
+SOURCE_COLUMN = "Source File"
+
+# Pool for the partitioned engines, which split one large file across
+# processes; started on first use and shared by every run of the process.
+PARTITION_WORKERS = int(os.environ.get("PARTITION_WORKERS", os.cpu_count() or 1))
+_partition_pool = None
+_partition_pool_lock = threading.Lock()
+
+# Reference template (and ledger) of the current worker process, built once
+# by the pool initializer and reused for every job the worker runs.
+_reference = None
+_ledger = None
+
+
+class JobResult:
+
+    def __init__(self, name, rows=0, seconds=0.0, output_rows=0, error_rows=0, error=None,
+                 output_df=None, error_df=None, stats=None, processed_keys=None):
+        self.name = name
+        self.rows = rows
+        self.seconds = seconds
+        self.output_rows = output_rows
+        self.error_rows = error_rows
+        self.error = error
+        self.output_df = output_df
+        self.error_df = error_df
+        self.stats = stats
+        self.processed_keys = processed_keys
+
+    @property
+    def status(self):
+        return "failed" if self.error else "ok"
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def expand_inputs(patterns):
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [
+                os.path.join(pattern, name) for name in os.listdir(pattern)
+                if name.lower().endswith(INPUT_EXTENSIONS) and not name.startswith("~$")
+            ]
+        else:
+            matches = glob.glob(pattern) or [pattern]
+        for path in sorted(matches):
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def write_frame(df, path, export_format):
+    data = write_csv(df) if export_format == "csv" else write_xlsx([("Sheet1", df)])
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def partition_pool():
+    # Started from file_handler.process_context(): callers need a main guard.
+    global _partition_pool
+    with _partition_pool_lock:
+        if _partition_pool is None:
+            _partition_pool = ProcessPoolExecutor(max_workers=PARTITION_WORKERS, mp_context=file_handler.process_context())
+        return _partition_pool
+
+
+def _init_worker(template_class, reference_files, ledger_path=None, store_path=None):
+    global _reference, _ledger, PARTITION_WORKERS
+    # The batch already runs one process per worker; reference files are
+    # parsed and large files processed in the worker itself rather than on
+    # nested parse and partition pools.
+    file_handler.PARSE_WORKERS = 1
+    PARTITION_WORKERS = 1
+    store = ReferenceStore(store_path) if store_path else None
+    _reference = template_class.from_reference(*reference_files, store=store)
+    _ledger = ProcessedLedger(ledger_path) if ledger_path else None
+
+
+def _process(reference, df, process_kwargs, ledger, name, shadow=False):
+    # With a ledger, rows it already has are skipped; the caller records the
+    # new ones with the returned template once the output is kept.
+    template = reference.with_input(df)
+    if ledger is not None:
+        template = template.new_only(ledger)
+    output_df, error_df = _run_engine(template, process_kwargs, name, shadow)
+    return template, output_df, error_df
+
+
+def _run_engine(template, process_kwargs, name, shadow=False):
+    # In shadow mode the legacy engine runs too and its differences are
+    # logged and counted; the output is still the selected engine's.
+    if shadow:
+        verification = verify(template, process_kwargs, name=name)
+        verification.log()
+        count("shadow differences", verification.difference_count)
+        return verification.frames[verification.candidate]
+    return template.process(**process_kwargs)
+
+
+def _stream(reference, df, process_kwargs, ledger, name, output_dir, export_format):
+    # Journal and error rows go to their files a chunk at a time, so no
+    # output frame for the whole file is ever built.
+    template = reference.with_input(df)
+    if ledger is not None:
+        template = template.new_only(ledger)
+    stem = os.path.splitext(name)[0]
+    with open_sink(os.path.join(output_dir, f"{stem}_output.{export_format}"), template.JOURNAL_SCHEMA.names,
+                   export_format) as output_sink, \
+            open_sink(os.path.join(output_dir, f"{stem}_errors.{export_format}"), template.ERROR_SCHEMA.names,
+                      export_format, keep_empty=False) as error_sink:
+        for output_df, error_df in template.stream(**process_kwargs):
+            output_sink.write(output_df)
+            error_sink.write(error_df)
+    if ledger is not None:
+        template.record_processed(ledger, name)
+    return output_sink.rows, error_sink.rows
+
+
+def _run_job(path, process_kwargs, output_dir, export_format, concat, trace=False, stream=False, shadow=False):
+    name = os.path.basename(path)
+    stats = RunStats(name, trace)
+    start = time.perf_counter()
+    output_df = error_df = processed_keys = None
+    try:
+        with stats.activate():
+            df = _reference.read_input(path, use_cache=False)
+            if stream:
+                output_rows, error_rows = _stream(_reference, df, process_kwargs, _ledger, name, output_dir, export_format)
+            else:
+                template, output_df, error_df = _process(_reference, df, process_kwargs, _ledger, name, shadow)
+                output_rows, error_rows = len(output_df), len(error_df)
+            # Rows go into the ledger only once their files are written; with
+            # concat that happens in the parent, after the combined files.
+            if not concat and not stream:
+                stem = os.path.splitext(name)[0]
+                write_frame(output_df, os.path.join(output_dir, f"{stem}_output.{export_format}"), export_format)
+                if not error_df.empty:
+                    write_frame(error_df, os.path.join(output_dir, f"{stem}_errors.{export_format}"), export_format)
+                if _ledger is not None:
+                    template.record_processed(_ledger, name)
+            elif concat and _ledger is not None:
+                processed_keys = template.processed_keys()
+        if trace:
+            stats.trace_frame().to_csv(os.path.join(output_dir, f"{os.path.splitext(name)[0]}_trace.csv"), index=False)
+    except Exception as e:
+        return JobResult(name, seconds=time.perf_counter() - start, error=str(e), stats=stats)
+
+    return JobResult(
+        name,
+        rows=len(df),
+        seconds=time.perf_counter() - start,
+        output_rows=output_rows,
+        error_rows=error_rows,
+        output_df=output_df if concat else None,
+        error_df=error_df if concat else None,
+        stats=stats,
+        processed_keys=processed_keys,
+    )
+
+
+def run_batch(template_class, reference_files, inputs, process_kwargs, output_dir,
+              export_format="xlsx", concat=False, workers=None, on_result=None, trace=False, ledger_path=None,
+              store_path=None, stream=False, shadow=False):
+    # A bad reference file would fail every worker's initializer; it is
+    # reported once, before the pool starts.
+    for read in template_class.reference_reads(*reference_files):
+        file_handler.FileHandler.check_header(read)
+    os.makedirs(output_dir, exist_ok=True)
+    results = {}
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(template_class, tuple(reference_files), ledger_path, store_path),
+    ) as pool:
+        futures = {
+            pool.submit(_run_job, path, process_kwargs, output_dir, export_format, concat, trace, stream, shadow): path
+            for path in inputs
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            result.stats.log()
+            if on_result:
+                on_result(result)
+
+    ordered = [results[path] for path in inputs]
+    if concat:
+        _write_concatenated(ordered, output_dir, export_format)
+        if ledger_path:
+            ledger = ProcessedLedger(ledger_path)
+            record_pending(ledger, template_class.LEDGER_KIND, pending_keys(ordered))
+            ledger.close()
+    return ordered
+
+
+def _write_concatenated(results, output_dir, export_format):
+    done = [result for result in results if result.error is None]
+    output_frames = [result.output_df for result in done if not result.output_df.empty]
+    error_frames = [result.error_df for result in done if not result.error_df.empty]
+    if output_frames:
+        write_frame(pd.concat(output_frames, ignore_index=True), os.path.join(output_dir, f"output.{export_format}"), export_format)
+    if error_frames:
+        write_frame(pd.concat(error_frames, ignore_index=True), os.path.join(output_dir, f"errors.{export_format}"), export_format)
+
+
+def source_name(file):
+    return getattr(file, "name", None) or os.path.basename(str(file))
+
+
+def pending_keys(results):
+    # Ledger keys of the rows each file of a batch processed, for the caller
+    # to record once the output is kept.
+    return [(result.name, result.processed_keys) for result in results if result.processed_keys is not None]
+
+
+def record_pending(ledger, kind, pending):
+    return sum(ledger.record(kind, keys, name) for name, keys in pending)
+
+
+class BatchLedger:
+    # The ledger as one file of a batch sees it: rows an earlier file of the
+    # same batch kept count as known too, though nothing is recorded yet.
+
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.claimed = set()
+
+    def known(self, kind, keys):
+        return self.ledger.known(kind, keys) | pd.Series(keys, dtype=object).isin(self.claimed).to_numpy()
+
+    def new_only(self, template):
+        template = template.new_only(self)
+        self.claimed.update(template.ledger_keys())
+        return template
+
+
+def _read_file(reference, file, trace=False, job=None):
+    name = source_name(file)
+    stats = RunStats(name, trace)
+    if job is not None:
+        job.track(stats)
+    start = time.perf_counter()
+    try:
+        with stats.activate():
+            df = reference.read_input(file)
+    except Exception as e:
+        return JobResult(name, seconds=time.perf_counter() - start, error=str(e), stats=stats), None
+    return JobResult(name, rows=len(df), seconds=time.perf_counter() - start, stats=stats), df
+
+
+def _batch_template(reference, result, df, batch_ledger):
+    if result.error is not None:
+        return None
+    try:
+        with result.stats.activate():
+            template = reference.with_input(df)
+            return batch_ledger.new_only(template) if batch_ledger is not None else template
+    except Exception as e:
+        result.error = str(e)
+        return None
+
+
+def _process_file(result, template, process_kwargs, shadow=False, keep_keys=False):
+    if result.error is not None:
+        return result
+    start = time.perf_counter()
+    try:
+        with result.stats.activate():
+            output_df, error_df = _run_engine(template, process_kwargs, result.name, shadow)
+            if keep_keys:
+                result.processed_keys = template.processed_keys()
+    except Exception as e:
+        result.error = str(e)
+    else:
+        result.output_df, result.error_df = output_df, error_df
+        result.output_rows, result.error_rows = len(output_df), len(error_df)
+    result.seconds += time.perf_counter() - start
+    return result
+
+
+def process_files(reference, files, process_kwargs, workers=None, trace=False, name="run", ledger=None, job=None,
+                  shadow=False):
+    # Parses and processes the transactional files on a thread pool against
+    # one shared reference template, then combines the results in upload
+    # order with the name of the file each row came from. With a ledger, the
+    # files are filtered in upload order between reading and processing, so
+    # rows that are in two files of the upload come out once; nothing is
+    # recorded until the caller passes the returned pending keys to
+    # record_pending(), once the output is kept.
+    workers = workers or min(len(files), os.cpu_count() or 1)
+    batch_ledger = BatchLedger(ledger) if ledger is not None else None
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        reads = list(pool.map(lambda file: _read_file(reference, file, trace, job), files))
+        templates = [_batch_template(reference, result, df, batch_ledger) for result, df in reads]
+        results = list(pool.map(
+            lambda read, template: _process_file(read[0], template, process_kwargs, shadow, ledger is not None),
+            reads, templates,
+        ))
+
+    stats = RunStats(name, trace)
+    for result in results:
+        result.stats.log()
+        stats.merge(result.stats)
+    stats.count("files", len(results))
+    stats.log()
+    return combine_results(results) + (status_frame(results), stats, pending_keys(results))
+
+
+def combine_results(results):
+    output_frames, error_frames = [], []
+    for result in results:
+        if result.error is None:
+            output_frames.append(result.output_df.assign(**{SOURCE_COLUMN: result.name}))
+            if not result.error_df.empty:
+                error_frames.append(result.error_df.assign(**{SOURCE_COLUMN: result.name}))
+    output_df = pd.concat(output_frames, ignore_index=True) if output_frames else pd.DataFrame()
+    error_df = pd.concat(error_frames, ignore_index=True) if error_frames else pd.DataFrame()
+    return output_df, error_df
+
+
+def status_frame(results):
+    return pd.DataFrame(
+        [
+            {
+                "File": result.name,
+                "Status": result.status,
+                "Rows": result.rows,
+                "Output Rows": result.output_rows,
+                "Error Rows": result.error_rows,
+                "Seconds": round(result.seconds, 3),
+                "Rows/s": round(result.rows_per_second),
+                "Error": result.error or "",
+            }
+            for result in results
+        ]
+    )
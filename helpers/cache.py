@@ -0,0 +1,116 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def estimate_size(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_size(item) for item in value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value.values())
+    if hasattr(value, "__dict__") and not isinstance(value, type):
+        return estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    # Thread-safe, bounded by the estimated size of the cached values. Module
+    # level instances live for the whole server process, so every Streamlit
+    # session shares them.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted
+        return value
+
+    def get_or_compute(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+
+def cache_limit(name, default_mb):
+    return int(os.environ.get(name, default_mb)) * 1024 * 1024
+
+
+PARSED_FRAMES = LRUCache(cache_limit("PARSED_CACHE_MB", 512))
+PROCESSED_RESULTS = LRUCache(cache_limit("RESULT_CACHE_MB", 256))
+_FILE_DIGESTS = LRUCache(1024 * 1024)
+
+
+def content_hash(file):
+    # Streamlit keeps a stable file_id per upload, so the bytes of an upload
+    # are only hashed once however many reruns ask for its digest.
+    file_id = getattr(file, "file_id", None)
+    if file_id is not None:
+        return _FILE_DIGESTS.get_or_compute(file_id, lambda: _hash_content(file))
+    return _hash_content(file)
+
+
+def _hash_content(file):
+    digest = hashlib.sha256()
+    if hasattr(file, "getbuffer"):
+        digest.update(file.getbuffer())
+    elif hasattr(file, "read"):
+        position = file.tell()
+        file.seek(0)
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+        file.seek(position)
+    else:
+        with open(file, "rb") as handle:
+            for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def result_key(name, files, *params):
+    return (name, tuple(content_hash(file) for file in files)) + params
@@ -0,0 +1,94 @@
+import hashlib
+import importlib.util
+import os
+import threading
+import uuid
+
+from helpers.cache import cache_limit
+
+HAS_ARROW = importlib.util.find_spec("pyarrow") is not None
+
+if HAS_ARROW:
+    import pyarrow as pa
+
+
+class ConversionCache:
+    # Parsed workbooks written once as uncompressed Arrow IPC files, keyed by
+    # content hash and read options. Reads memory-map the file, so only the
+    # pages of the selected columns are touched. The directory is capped in
+    # size; the least recently read files go first.
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(repr(key).encode()).hexdigest() + ".arrow")
+
+    def get(self, key, columns=None):
+        path = self.path(key)
+        try:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+            os.utime(path)
+        except (OSError, pa.ArrowException):
+            return None
+        if columns is not None:
+            table = table.select(list(columns))
+        return table.to_pandas()
+
+    def put(self, key, df):
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowException, TypeError, ValueError):
+            # Columns of mixed types have no Arrow equivalent; such files are
+            # simply parsed every time.
+            return False
+        path = self.path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with pa.OSFile(temp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(temp_path, path)
+        except (OSError, pa.ArrowException):
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+        self.evict()
+        return True
+
+    def evict(self):
+        with self._lock:
+            try:
+                entries = [entry for entry in os.scandir(self.directory) if entry.name.endswith(".arrow")]
+            except OSError:
+                return
+            files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries), reverse=True)
+            total = 0
+            for _, size, path in files:
+                total += size
+                if total > self.max_bytes:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def size(self):
+        try:
+            return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(".arrow"))
+        except OSError:
+            return 0
+
+    def clear(self):
+        max_bytes, self.max_bytes = self.max_bytes, 0
+        self.evict()
+        self.max_bytes = max_bytes
+
+
+CONVERSION_CACHE_DIR = os.environ.get("CONVERSION_CACHE_DIR", ".conversion_cache")
+CONVERTED = (
+    ConversionCache(CONVERSION_CACHE_DIR, cache_limit("CONVERSION_CACHE_MB", 2048))
+    if HAS_ARROW and CONVERSION_CACHE_DIR else None
+)
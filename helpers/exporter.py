@@ -0,0 +1,222 @@
+import importlib.util
+import io
+import os
+import tempfile
+import zipfile
+
+import pandas as pd
+
+from helpers.cache import LRUCache, cache_limit
+from helpers.instrumentation import RunStats, stage
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CHUNK_ROWS = 10000
+# Rows of an xlsx sheet, the header included.
+XLSX_MAX_ROWS = 1048576
+
+EXPORTED_FILES = LRUCache(cache_limit("EXPORT_CACHE_MB", 256))
+
+
+def iter_rows(df):
+    # Rows as plain lists with missing values as None, a chunk at a time so
+    # the object copy never covers the whole frame.
+    for start in range(0, len(df), CHUNK_ROWS):
+        chunk = df.iloc[start:start + CHUNK_ROWS].astype(object)
+        yield from chunk.where(chunk.notna(), None).to_numpy().tolist()
+
+
+def check_sheet_rows(name, rows):
+    # The writers stop silently at the last row of a sheet; a journal that
+    # does not fit is refused instead of cut short.
+    if rows + 1 > XLSX_MAX_ROWS:
+        raise ValueError(
+            f"Sheet '{name}' has {rows} rows, more than an xlsx sheet holds ({XLSX_MAX_ROWS - 1}); export it as CSV instead"
+        )
+
+
+def write_xlsx(sheets):
+    for name, df in sheets:
+        check_sheet_rows(name, len(df))
+    with stage("export"):
+        if importlib.util.find_spec("xlsxwriter"):
+            return _write_xlsx_constant_memory(sheets)
+        return _write_xlsx_write_only(sheets)
+
+
+def _write_xlsx_constant_memory(sheets):
+    import xlsxwriter
+
+    # constant_memory flushes each row to disk as it is written; it is not
+    # available with in_memory output, so the workbook goes via a temp file.
+    handle, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    try:
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "default_date_format": "yyyy-mm-dd hh:mm:ss"})
+        for name, df in sheets:
+            worksheet = workbook.add_worksheet(name)
+            worksheet.write_row(0, 0, [str(column) for column in df.columns])
+            for row_number, row in enumerate(iter_rows(df), start=1):
+                worksheet.write_row(row_number, 0, row)
+        workbook.close()
+        with open(path, "rb") as file:
+            return file.read()
+    finally:
+        os.remove(path)
+
+
+def _write_xlsx_write_only(sheets):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for name, df in sheets:
+        worksheet = workbook.create_sheet(name)
+        worksheet.append([str(column) for column in df.columns])
+        for row in iter_rows(df):
+            worksheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def write_csv(df):
+    buffer = io.BytesIO()
+    with stage("export"):
+        df.to_csv(buffer, index=False, chunksize=CHUNK_ROWS)
+    return buffer.getvalue()
+
+
+def write_zipped_csv(sheets):
+    buffer = io.BytesIO()
+    with stage("export"), zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, df in sheets:
+            with archive.open(f"{name}.csv", "w") as member:
+                df.to_csv(member, index=False, chunksize=CHUNK_ROWS)
+    return buffer.getvalue()
+
+
+class FrameSink:
+    # Frames appended one after another to a file, for output that is
+    # produced a chunk at a time: only the chunk being written is held. The
+    # columns are fixed when the sink opens; an empty sink leaves no file
+    # unless keep_empty is set, and neither does one left by an error.
+
+    def __init__(self, path, columns, keep_empty=True):
+        self.path = path
+        self.columns = list(columns)
+        self.keep_empty = keep_empty
+        self.rows = 0
+
+    def write(self, df):
+        if len(df):
+            with stage("export"):
+                self._write(df.reindex(columns=self.columns))
+            self.rows += len(df)
+
+    def close(self):
+        self._close()
+        if not self.rows and not self.keep_empty and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        if exc_type is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class CsvSink(FrameSink):
+
+    def __init__(self, path, columns, keep_empty=True):
+        super().__init__(path, columns, keep_empty)
+        self._file = open(path, "w", newline="", encoding="utf-8")
+        pd.DataFrame(columns=self.columns).to_csv(self._file, index=False)
+
+    def _write(self, df):
+        df.to_csv(self._file, index=False, header=False, chunksize=CHUNK_ROWS)
+
+    def _close(self):
+        self._file.close()
+
+
+class XlsxSink(FrameSink):
+
+    def __init__(self, path, columns, keep_empty=True, sheet_name="Sheet1"):
+        super().__init__(path, columns, keep_empty)
+        self.sheet_name = sheet_name
+        if importlib.util.find_spec("xlsxwriter"):
+            import xlsxwriter
+
+            self._workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "default_date_format": "yyyy-mm-dd hh:mm:ss"})
+            self._worksheet = self._workbook.add_worksheet(sheet_name)
+            self._worksheet.write_row(0, 0, self.columns)
+        else:
+            from openpyxl import Workbook
+
+            self._workbook = Workbook(write_only=True)
+            self._worksheet = self._workbook.create_sheet(sheet_name)
+            self._worksheet.append(self.columns)
+
+    def _write(self, df):
+        check_sheet_rows(self.sheet_name, self.rows + len(df))
+        if hasattr(self._worksheet, "write_row"):
+            for row_number, row in enumerate(iter_rows(df), start=self.rows + 1):
+                self._worksheet.write_row(row_number, 0, row)
+        else:
+            for row in iter_rows(df):
+                self._worksheet.append(row)
+
+    def _close(self):
+        if hasattr(self._workbook, "save"):
+            self._workbook.save(self.path)
+        else:
+            self._workbook.close()
+
+
+def open_sink(path, columns, export_format="xlsx", keep_empty=True):
+    sink = CsvSink if export_format == "csv" else XlsxSink
+    return sink(path, columns, keep_empty)
+
+
+class ExportFormat:
+
+    def __init__(self, label, extension, mime, write, both_sheets):
+        self.label = label
+        self.extension = extension
+        self.mime = mime
+        self.write = write
+        self.both_sheets = both_sheets
+
+
+EXPORT_FORMATS = {
+    "xlsx": ExportFormat("Excel", "xlsx", XLSX_MIME, lambda sheets: write_xlsx(sheets[:1]), False),
+    "workbook": ExportFormat("Excel, output and errors in one workbook", "xlsx", XLSX_MIME, write_xlsx, True),
+    "csv": ExportFormat("CSV", "csv", "text/csv", lambda sheets: write_csv(sheets[0][1]), False),
+    "zip": ExportFormat("Zipped CSV, output and errors", "zip", "application/zip", write_zipped_csv, True),
+}
+
+
+def export_bytes(result_key, sheets, export_format):
+    # Built when first asked for and memoized per processed result, so
+    # re-rendering a page never serializes the same frames twice.
+    sheet_names = tuple(name for name, _ in sheets)
+    return EXPORTED_FILES.get_or_compute(
+        (result_key, sheet_names, export_format),
+        lambda: _export(sheets, export_format),
+    )
+
+
+def _export(sheets, export_format):
+    # Downloads are built outside the run that processed the files, so each
+    # export is measured and logged on its own.
+    stats = RunStats(f"export {export_format}")
+    with stats.activate():
+        data = EXPORT_FORMATS[export_format].write(list(sheets))
+    stats.count("rows out", sum(len(df) for _, df in sheets))
+    stats.log()
+    return data
+
+
+def exporter(result_key, sheets, export_format):
+    return lambda: export_bytes(result_key, sheets, export_format)
@@ -1,7 +1,60 @@
+import importlib.util
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+
 import pandas as pd
 
+from helpers.cache import PARSED_FRAMES, content_hash
+from helpers.conversion_cache import CONVERTED
+from helpers.instrumentation import stage
+
+# Workbook parsing is CPU bound, so files read together are parsed in
+# separate processes. The pool is started on first use and shared by every
+# session of the server process.
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", min(3, os.cpu_count() or 1)))
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def process_context():
+    # Pools are started from the threaded Streamlit server, so workers are
+    # not forked from it but from a fork server that has only imported the
+    # readers. Every worker imports the main script again (as __mp_main__),
+    # so a script that uses these pools must keep its work under
+    # `if __name__ == "__main__":`, or its workers fail and the pool is
+    # broken; the pages, cli.py and the benchmarks all do.
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["helpers.file_handler"])
+    return context
+
+
+def parse_pool():
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=process_context())
+        return _parse_pool
+
+
+def _parse_in_worker(source, key, required_columns, optional_columns, dtypes, file_name, converted_directory):
+    # The worker outlives changes to the conversion cache directory in the
+    # parent, so it is told the current one with every file.
+    if CONVERTED is not None:
+        CONVERTED.directory = converted_directory
+    file = io.BytesIO(source) if isinstance(source, bytes) else source
+    return FileHandler._read_converted(file, key, required_columns, optional_columns, dtypes, file_name)
+
 
 class FileHandler:
+    # python-calamine parses xlsx several times faster than openpyxl; pandas'
+    # openpyxl reader already streams the sheet in read-only mode otherwise.
+    ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+
     @staticmethod
     def read_excel(file):
         try:
@@ -10,8 +63,153 @@ class FileHandler:
             raise ValueError(f"Error reading file: {e}")
 
     @staticmethod
-    def validate_columns(df, required_columns, file_name="File"):
-        missing = [col for col in required_columns if col not in df.columns]
+    def read_header(file):
+        FileHandler.rewind(file)
+        try:
+            header = pd.read_excel(file, nrows=0, engine=FileHandler.ENGINE)
+        except Exception as e:
+            raise ValueError(f"Error reading file: {e}")
+        return [str(column) for column in header.columns]
+
+    @staticmethod
+    def read_columns(file, required_columns, optional_columns=(), dtypes=None, file_name="File", use_cache=True):
+        # Parsed frames are cached by content hash and read options, and are
+        # shared between callers: treat the returned frame as read-only.
+        # use_cache=False only skips the in-memory cache; the on-disk
+        # conversion cache is shared by every process.
+        key = FileHandler.cache_key(file, required_columns, optional_columns, dtypes)
+        read = lambda: FileHandler._read_converted(file, key, required_columns, optional_columns, dtypes, file_name)
+        if not use_cache:
+            return read()
+        return PARSED_FRAMES.get_or_compute(key, read).copy(deep=False)
+
+    @staticmethod
+    def cache_key(file, required_columns, optional_columns=(), dtypes=None):
+        return (
+            content_hash(file),
+            tuple(sorted(required_columns)),
+            tuple(optional_columns),
+            tuple(sorted((column, getattr(kind, "__name__", str(kind))) for column, kind in (dtypes or {}).items())),
+        )
+
+    @staticmethod
+    def read_many(reads):
+        # Several read_columns() calls (given as dicts of their arguments) at
+        # once. Files in neither cache are parsed on the parse pool, where each
+        # validates its header before parsing the body; the first failure is
+        # raised right away, without waiting for the other files.
+        frames = [None] * len(reads)
+        pending = {}
+        for position, read in enumerate(reads):
+            key = FileHandler.cache_key(
+                read["file"], read["required_columns"], read.get("optional_columns", ()), read.get("dtypes")
+            )
+            cached = PARSED_FRAMES.get(key)
+            if cached is not None:
+                frames[position] = cached.copy(deep=False)
+            elif CONVERTED is not None and os.path.exists(CONVERTED.path(key)):
+                frames[position] = FileHandler.read_columns(**read)
+            else:
+                pending[position] = key
+        if len(pending) < 2 or PARSE_WORKERS < 2:
+            for position in pending:
+                frames[position] = FileHandler.read_columns(**reads[position])
+            return frames
+
+        with stage("parallel read"):
+            futures = {
+                parse_pool().submit(
+                    _parse_in_worker,
+                    FileHandler.source(reads[position]["file"]),
+                    key,
+                    reads[position]["required_columns"],
+                    reads[position].get("optional_columns", ()),
+                    reads[position].get("dtypes"),
+                    reads[position].get("file_name", "File"),
+                    CONVERTED.directory if CONVERTED is not None else None,
+                ): position
+                for position, key in pending.items()
+            }
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            failed = [future for future in done if future.exception() is not None]
+            if failed:
+                for future in not_done:
+                    future.cancel()
+                raise failed[0].exception()
+        for future, position in futures.items():
+            df = PARSED_FRAMES.put(pending[position], future.result())
+            frames[position] = df.copy(deep=False)
+        return frames
+
+    @staticmethod
+    def check_header(read):
+        # The header check of a read_many() entry alone, without the body.
+        header = FileHandler.read_header(read["file"])
+        FileHandler.validate_header({column.strip() for column in header}, read["required_columns"], read.get("file_name", "File"))
+
+    @staticmethod
+    def source(file):
+        # What a parse worker gets for a file: paths as they are, the bytes
+        # of uploads and other file objects.
+        if isinstance(file, (str, os.PathLike)):
+            return file
+        if hasattr(file, "getbuffer"):
+            return bytes(file.getbuffer())
+        FileHandler.rewind(file)
+        data = file.read()
+        FileHandler.rewind(file)
+        return data
+
+    @staticmethod
+    def _read_converted(file, key, required_columns, optional_columns, dtypes, file_name):
+        if CONVERTED is None:
+            return FileHandler._read_columns(file, required_columns, optional_columns, dtypes, file_name)
+        with stage("converted read"):
+            df = CONVERTED.get(key)
+        if df is None:
+            df = FileHandler._read_columns(file, required_columns, optional_columns, dtypes, file_name)
+            with stage("conversion"):
+                CONVERTED.put(key, df)
+        return df
+
+    @staticmethod
+    def _read_columns(file, required_columns, optional_columns, dtypes, file_name):
+        # Validates the header before the body is parsed, then reads only the
+        # columns the templates use. Column names are matched after stripping.
+        with stage("column validation"):
+            header = FileHandler.read_header(file)
+            stripped = {column.strip(): column for column in header}
+            FileHandler.validate_header(stripped, required_columns, file_name)
+
+        wanted = set(required_columns) | {column for column in optional_columns if column in stripped}
+        dtype = {stripped[column]: kind for column, kind in (dtypes or {}).items() if column in wanted}
+
+        FileHandler.rewind(file)
+        try:
+            with stage("file read"):
+                df = pd.read_excel(
+                    file,
+                    engine=FileHandler.ENGINE,
+                    usecols=lambda column: str(column).strip() in wanted,
+                    dtype=dtype,
+                )
+        except Exception as e:
+            raise ValueError(f"Error reading file: {e}")
+        df.columns = df.columns.str.strip()
+        return df
+
+    @staticmethod
+    def rewind(file):
+        if hasattr(file, "seek"):
+            file.seek(0)
+
+    @staticmethod
+    def validate_header(columns, required_columns, file_name="File"):
+        missing = [col for col in required_columns if col not in columns]
         if missing:
             raise ValueError(f"{file_name} is missing columns: {', '.join(missing)}")
         return True
+
+    @staticmethod
+    def validate_columns(df, required_columns, file_name="File"):
+        return FileHandler.validate_header(df.columns, required_columns, file_name)
@@ -0,0 +1,174 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger("thakker.run_stats")
+
+MAX_TRACES = 100000
+PROGRESS_ROWS = 1000
+
+_active = contextvars.ContextVar("run_stats", default=None)
+
+
+class Cancelled(Exception):
+    pass
+
+
+class RunStats:
+    # Stage timings and row counters for one run. Code being measured talks to
+    # whichever RunStats is active in its context (see stage/count/trace
+    # below), so nothing has to be threaded through the call chain.
+
+    def __init__(self, name="", trace=False):
+        self.name = name
+        self.tracing = trace
+        self.stages = {}
+        self.counters = {}
+        self.errors = {}
+        self.traces = []
+        self.cancel_event = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["cancel_event"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise Cancelled(f"{self.name or 'Run'} was cancelled")
+
+    @contextmanager
+    def activate(self):
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    @contextmanager
+    def stage(self, name):
+        self.check_cancelled()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def error(self, category, value=1):
+        if value:
+            with self._lock:
+                self.errors[category] = self.errors.get(category, 0) + int(value)
+
+    def trace(self, records):
+        with self._lock:
+            self.traces.extend(records[:MAX_TRACES - len(self.traces)])
+
+    def merge(self, other):
+        for name, seconds in other.stages.items():
+            self.add_time(name, seconds)
+        for name, value in other.counters.items():
+            self.count(name, value)
+        for category, value in other.errors.items():
+            self.error(category, value)
+        self.trace(other.traces)
+        return self
+
+    def to_dict(self):
+        return {
+            "run": self.name,
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+            "errors": dict(self.errors),
+            "traced": len(self.traces),
+        }
+
+    def stage_frame(self):
+        return pd.DataFrame({"Stage": list(self.stages), "Seconds": [round(value, 4) for value in self.stages.values()]})
+
+    def counter_frame(self):
+        rows = [("rows", name, value) for name, value in self.counters.items()]
+        rows += [("errors", category, value) for category, value in self.errors.items()]
+        return pd.DataFrame(rows, columns=["Kind", "Name", "Count"])
+
+    def trace_frame(self):
+        return pd.DataFrame(self.traces)
+
+    def log(self, level=logging.INFO):
+        logger.log(level, json.dumps(self.to_dict(), sort_keys=True), extra={"run_stats": self.to_dict()})
+
+
+def active_stats():
+    return _active.get()
+
+
+@contextmanager
+def stage(name):
+    stats = _active.get()
+    if stats is None:
+        yield
+        return
+    with stats.stage(name):
+        yield
+
+
+def start_stage(name):
+    # Like stage(), for long blocks that are not worth re-indenting under a
+    # with statement: returns the function that ends the stage.
+    stats = _active.get()
+    if stats is None:
+        return lambda: None
+    stats.check_cancelled()
+    start = time.perf_counter()
+    return lambda: stats.add_time(name, time.perf_counter() - start)
+
+
+def count(name, value=1):
+    stats = _active.get()
+    if stats is not None:
+        stats.count(name, value)
+
+
+def progress(rows):
+    # Rows an engine has worked through so far; also where long loops notice
+    # that their run was cancelled.
+    stats = _active.get()
+    if stats is not None:
+        stats.count("rows processed", rows)
+        stats.check_cancelled()
+
+
+def count_errors(categories):
+    stats = _active.get()
+    if stats is not None:
+        for category, value in categories.items():
+            stats.error(category, value)
+
+
+def tracing():
+    stats = _active.get()
+    return stats is not None and stats.tracing
+
+
+def trace(records):
+    stats = _active.get()
+    if stats is not None and stats.tracing:
+        stats.trace(records)
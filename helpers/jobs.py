@@ -0,0 +1,75 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Shared by every session of the server process: each job gets its own
+# thread, so one long run does not hold up the others.
+JOB_POOL = ThreadPoolExecutor(max_workers=int(os.environ.get("JOB_WORKERS", 8)), thread_name_prefix="job")
+
+
+class Job:
+    # A run on the job pool. The function it runs registers the RunStats of
+    # each file with track(); progress is read from their counters, and a
+    # cancel is seen by the engines at their next stage or progress report.
+
+    def __init__(self, name, total_files, key=None):
+        self.name = name
+        self.total_files = total_files
+        self.key = key
+        self.future = None
+        self.started = time.perf_counter()
+        self._stats = []
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def track(self, stats):
+        stats.cancel_event = self._cancel
+        with self._lock:
+            self._stats.append(stats)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    @property
+    def status(self):
+        if not self.done:
+            return "cancelling" if self.cancelled else "running"
+        if self.cancelled:
+            return "cancelled"
+        return "failed" if self.future.exception() is not None else "done"
+
+    def progress(self):
+        with self._lock:
+            stats = list(self._stats)
+        rows_done = sum(item.counters.get("rows processed", 0) for item in stats)
+        rows_total = sum(item.counters.get("rows in", 0) for item in stats)
+        file_fractions = [
+            min(item.counters.get("rows processed", 0) / item.counters["rows in"], 1.0)
+            for item in stats if item.counters.get("rows in")
+        ]
+        seconds = time.perf_counter() - self.started
+        return {
+            "rows_done": rows_done,
+            "rows_total": rows_total,
+            "fraction": 1.0 if self.done else sum(file_fractions) / max(self.total_files, 1),
+            "seconds": seconds,
+            "rows_per_second": rows_done / seconds if seconds else 0.0,
+        }
+
+    def result(self):
+        return self.future.result()
+
+
+def start_job(name, function, total_files, key=None):
+    job = Job(name, total_files, key)
+    job.future = JOB_POOL.submit(function, job)
+    return job
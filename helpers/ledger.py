@@ -0,0 +1,84 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from helpers.sqlite_file import SqliteFile, shared_file
+
+DEFAULT_LEDGER = os.environ.get("LEDGER_PATH", "processed_orders.sqlite")
+
+
+class ProcessedLedger(SqliteFile):
+    # Keys of rows that were already turned into ERP documents, one table for
+    # every kind of input.
+
+    def __init__(self, path=DEFAULT_LEDGER):
+        super().__init__(path)
+        self._connection.execute("PRAGMA temp_store=MEMORY")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, run TEXT, recorded_at REAL, "
+            "PRIMARY KEY (kind, key)) WITHOUT ROWID"
+        )
+
+    def known(self, kind, keys):
+        # Anti-join of the distinct keys against the primary key index; only
+        # the keys missing from the ledger come back.
+        keys = pd.Series(keys, dtype=object)
+        unique = keys.dropna().unique()
+        if not len(unique):
+            return np.zeros(len(keys), dtype=bool)
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS candidate (key TEXT PRIMARY KEY) WITHOUT ROWID")
+            cursor.execute("BEGIN")
+            cursor.execute("DELETE FROM candidate")
+            cursor.executemany("INSERT OR IGNORE INTO candidate VALUES (?)", ((key,) for key in unique))
+            cursor.execute("COMMIT")
+            new_keys = [
+                key for (key,) in cursor.execute(
+                    "SELECT key FROM candidate WHERE NOT EXISTS "
+                    "(SELECT 1 FROM processed WHERE processed.kind = ? AND processed.key = candidate.key)",
+                    (kind,),
+                )
+            ]
+            cursor.execute("DELETE FROM candidate")
+        return (keys.notna() & ~keys.isin(new_keys)).to_numpy()
+
+    def record(self, kind, keys, run=""):
+        keys = pd.Series(keys, dtype=object).dropna().unique()
+        recorded_at = time.time()
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cursor.executemany(
+                    "INSERT OR IGNORE INTO processed VALUES (?, ?, ?, ?)",
+                    ((kind, key, run, recorded_at) for key in keys),
+                )
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+        return len(keys)
+
+    def size(self, kind):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM processed WHERE kind = ?", (kind,)).fetchone()[0]
+
+
+
+def line_keys(df, columns):
+    # One key per row from the given columns; identical rows get an
+    # occurrence suffix so repeated lines of one file stay distinct.
+    joined = None
+    for column in columns:
+        values = df[column].astype(object).where(df[column].notna(), "").astype(str)
+        joined = values if joined is None else joined + "|" + values
+    occurrence = joined.groupby(joined, sort=False).cumcount()
+    return (joined + "|" + occurrence.astype(str)).to_numpy(dtype=object)
+
+
+def shared_ledger(path=DEFAULT_LEDGER):
+    return shared_file(ProcessedLedger, path)
@@ -0,0 +1,125 @@
+import os
+import time
+
+import pandas as pd
+
+from helpers.cache import content_hash
+from helpers.sqlite_file import SqliteFile, shared_file
+
+DEFAULT_STORE = os.environ.get("REFERENCE_STORE_PATH", "reference_data.sqlite")
+KEEP_VERSIONS = 5
+
+
+class ReferenceStore(SqliteFile):
+    # Reference files (CP items, bundles, matching template) kept in SQLite,
+    # one indexed table per version, versions named by the content hash of
+    # the uploaded file. Loaded frames are kept for the life of the process.
+
+    def __init__(self, path=DEFAULT_STORE):
+        super().__init__(path)
+        self._frames = {}
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS versions ("
+            "name TEXT NOT NULL, version TEXT NOT NULL, file_name TEXT, rows INTEGER, stored_at REAL, "
+            "PRIMARY KEY (name, version))"
+        )
+        self._connection.execute("CREATE TABLE IF NOT EXISTS current (name TEXT PRIMARY KEY, version TEXT NOT NULL)")
+
+    @staticmethod
+    def _table(name, version):
+        return f"{name}_{version[:16]}"
+
+    def put(self, name, df, version, index_columns=(), file_name=""):
+        # Storing a version does not change the current one, which sessions
+        # without an upload of their own use; only the first version of a
+        # reference becomes current by itself, later ones by set_current().
+        table = self._table(name, version)
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                known = cursor.execute(
+                    "SELECT 1 FROM versions WHERE name = ? AND version = ?", (name, version)
+                ).fetchone()
+                if known is None:
+                    columns = ", ".join(f'"{column}"' for column in df.columns)
+                    cursor.execute(f'DROP TABLE IF EXISTS "{table}"')
+                    cursor.execute(f'CREATE TABLE "{table}" ({columns})')
+                    cursor.executemany(
+                        f'INSERT INTO "{table}" VALUES ({", ".join("?" * len(df.columns))})',
+                        df.astype(object).where(df.notna(), None).itertuples(index=False, name=None),
+                    )
+                    for column in index_columns:
+                        cursor.execute(f'CREATE INDEX "{table}_{column}" ON "{table}" ("{column}")')
+                    cursor.execute(
+                        "INSERT INTO versions VALUES (?, ?, ?, ?, ?)", (name, version, file_name, len(df), time.time())
+                    )
+                cursor.execute("INSERT OR IGNORE INTO current VALUES (?, ?)", (name, version))
+                self._prune(cursor, name)
+            except Exception:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+            self._frames.setdefault((name, version), df)
+        return version
+
+    def set_current(self, name, version):
+        with self._lock:
+            changed = self._connection.execute(
+                "INSERT OR REPLACE INTO current SELECT name, version FROM versions WHERE name = ? AND version = ?",
+                (name, version),
+            ).rowcount
+        if not changed:
+            raise ValueError(f"Version {version} of {name} is not in the reference store")
+
+    def _prune(self, cursor, name):
+        stale = cursor.execute(
+            "SELECT version FROM versions WHERE name = ? AND version != (SELECT version FROM current WHERE name = ?) "
+            "ORDER BY stored_at DESC LIMIT -1 OFFSET ?",
+            (name, name, KEEP_VERSIONS - 1),
+        ).fetchall()
+        for (version,) in stale:
+            cursor.execute(f'DROP TABLE IF EXISTS "{self._table(name, version)}"')
+            cursor.execute("DELETE FROM versions WHERE name = ? AND version = ?", (name, version))
+            self._frames.pop((name, version), None)
+
+    def current_version(self, name):
+        with self._lock:
+            row = self._connection.execute("SELECT version FROM current WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def info(self, name):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT versions.version, file_name, rows, stored_at FROM current "
+                "JOIN versions ON versions.name = current.name AND versions.version = current.version "
+                "WHERE current.name = ?",
+                (name,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"version": row[0], "file_name": row[1], "rows": row[2], "stored_at": row[3]}
+
+    def resolve(self, names, files):
+        # The version each reference is used at: the upload's when there is
+        # one, the stored one otherwise (None when neither exists).
+        return tuple(
+            content_hash(file) if file is not None else self.current_version(name) for name, file in zip(names, files)
+        )
+
+    def load(self, name, version=None, dtypes=None, label=None):
+        version = version or self.current_version(name)
+        if version is None:
+            raise ValueError(f"No {label or name} in the reference store, please upload one")
+        with self._lock:
+            if (name, version) not in self._frames:
+                cursor = self._connection.execute(f'SELECT * FROM "{self._table(name, version)}"')
+                df = pd.DataFrame.from_records(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+                # NULLs stay missing values; cast to str on pandas < 3 they
+                # would become the text "None".
+                self._frames[(name, version)] = df.astype(dtypes).where(df.notna()) if dtypes else df
+            return self._frames[(name, version)]
+
+
+def shared_store(path=DEFAULT_STORE):
+    return shared_file(ReferenceStore, path)
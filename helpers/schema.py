@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+
+class Column:
+    # One output column, filled either from a field the engine computed or
+    # with a constant. Several columns may be fed by the same field.
+
+    def __init__(self, name, field=None, default=None, dtype=None):
+        self.name = name
+        self.field = field
+        self.default = default
+        self.dtype = dtype
+
+    @property
+    def constant(self):
+        return self.field is None and self.default is not None
+
+
+class OutputSchema:
+    # Column order, constants, dtypes and feeding fields of one output. The
+    # frame is built in one go from columnar arrays; a computed column is
+    # only present when its field was given, constants always are.
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+
+    @property
+    def names(self):
+        return [column.name for column in self.columns]
+
+    def build(self, fields, length=None):
+        if length is None:
+            length = len(next(iter(fields.values()))) if fields else 0
+        data = {}
+        for column in self.columns:
+            if column.constant:
+                data[column.name] = column.default
+            elif (column.field or column.name) in fields:
+                data[column.name] = fields[column.field or column.name]
+        df = pd.DataFrame(data, index=pd.RangeIndex(length))
+        dtypes = {column.name: column.dtype for column in self.columns if column.dtype is not None and column.name in data}
+        return df.astype(dtypes) if dtypes else df
+
+    def conform(self, df):
+        # An already built frame in schema order and dtypes; columns outside
+        # the schema are dropped.
+        return self.build({name: df[name] for name in self.names if name in df}, len(df))
+
+    def from_records(self, rows):
+        # For engines that build one dict per row: a field missing from a
+        # row is NaN, as in pd.DataFrame(rows).
+        fields = {}
+        for row in rows:
+            for field in row:
+                fields.setdefault(field, None)
+        return self.build({field: [row.get(field, np.nan) for row in rows] for field in fields}, len(rows))
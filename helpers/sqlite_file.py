@@ -0,0 +1,36 @@
+import sqlite3
+import threading
+
+
+class SqliteFile:
+    # A SQLite file opened once per process in WAL mode; threads share the
+    # connection under a lock. Pickled, it is just its path, so process pool
+    # workers open their own connection.
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def close(self):
+        self._connection.close()
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def shared_file(cls, path):
+    # One instance per class and file for the whole server process, so every
+    # session reuses the same connection (and whatever it has loaded).
+    with _shared_lock:
+        if (cls, path) not in _shared:
+            _shared[(cls, path)] = cls(path)
+        return _shared[(cls, path)]
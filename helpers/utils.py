@@ -1,10 +1,27 @@
 import re
 
+import numpy as np
+import pandas as pd
+
 def extract_pack_of_quantity(item_id):
     match = re.search(r'\(Pack of (\d+)\)', item_id)
     return int(match.group(1)) if match else 1
 
 
+def pack_of_quantities(item_ids):
+    # extract_pack_of_quantity over a whole column in one pass.
+    packs = pd.Series(item_ids, dtype=object).astype(str).str.extract(r'\(Pack of (\d+)\)', expand=False)
+    return packs.fillna(1).astype(np.int64).to_numpy()
+
+
+def whole_numbers(values):
+    # Quantities as int64; blanks, text and fractions become 0, which the
+    # engines report as a rate error instead of emitting a line.
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=float)
+    whole = np.isfinite(numbers) & (numbers == np.round(numbers))
+    return np.where(whole, numbers, 0).astype(np.int64)
+
+
 def calculate_price_per_packet(total_amount, product_bundle_quantity, amazon_quantity):
     if product_bundle_quantity * amazon_quantity == 0:
         return 0
@@ -15,3 +32,76 @@ def format_state(state):
     if not state or isinstance(state, float):
         return "Unknown"
     return state.strip().title()
+
+
+ISO_OFFSET = r"(?:Z|[+-]\d{2}:?\d{2}(?::?\d{2}(?:\.\d+)?)?)$"
+
+
+def normalize_dates(values, input_format, output_format="%Y-%m-%d"):
+    # Parses each distinct value once with an explicit format and returns the
+    # formatted strings, None where a value does not parse, with the mask of
+    # those values. "ISO8601" keeps the date as written whatever the offset,
+    # as datetime.fromisoformat does.
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+    text = pd.Series([None if pd.isna(value) else str(value) for value in uniques], dtype=object)
+    if input_format == "ISO8601":
+        text = text.str.replace(ISO_OFFSET, "", regex=True)
+    parsed = pd.to_datetime(text, format=input_format, errors="coerce")
+    invalid = parsed.isna().to_numpy()
+    formatted = np.empty(len(uniques), dtype=object)
+    formatted[~invalid] = parsed[~invalid].dt.strftime(output_format).tolist()
+    return formatted[codes], invalid[codes]
+
+
+def map_unique(values, func):
+    # Applies func once per distinct value and broadcasts the results back,
+    # so repeated states/dates in a large report cost a single call each.
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    mapped = np.empty(len(uniques), dtype=object)
+    mapped[:] = [func(value) for value in uniques]
+    return mapped[codes]
+
+
+def lookup_first(keys, table, key_column, value_columns):
+    # Hash join of keys against the first row of table for each key, the same
+    # row a boolean filter followed by .iloc[0] would pick. Returns the matched
+    # positions mask and the looked-up values per column.
+    index = table.dropna(subset=[key_column]).drop_duplicates(key_column, keep='first')
+    positions = pd.Index(index[key_column]).get_indexer(keys)
+    found = positions >= 0
+    values = {
+        column: index[column].to_numpy()[positions[found]]
+        for column in value_columns
+    }
+    return found, values
+
+
+def to_paise(values):
+    # Rupee amounts as exact int64 paise; missing amounts count as zero.
+    return np.rint(np.nan_to_num(np.asarray(values, dtype=float)) * 100).astype(np.int64)
+
+
+def to_rupees(paise):
+    return np.asarray(paise, dtype=np.int64) / 100
+
+
+def round_to_rupee(paise):
+    # Half to even, the rule round() applies to a float rupee total.
+    rupees, remainder = np.divmod(np.asarray(paise, dtype=np.int64), 100)
+    up = (remainder > 50) | ((remainder == 50) & (rupees % 2 == 1))
+    return (rupees + up) * 100
+
+
+def group_sum(codes, values, size):
+    totals = np.zeros(size, dtype=np.int64)
+    np.add.at(totals, codes, values)
+    return totals
+
+
+def contains_text(df, query, columns=None):
+    # Case-insensitive substring match of any of the columns (all by default).
+    mask = np.zeros(len(df), dtype=bool)
+    for column in columns or df.columns:
+        if column in df:
+            mask |= df[column].astype(str).str.contains(query, case=False, regex=False).to_numpy()
+    return mask
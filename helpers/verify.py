@@ -0,0 +1,139 @@
+import copy
+import logging
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+from helpers.instrumentation import RunStats, active_stats
+
+logger = logging.getLogger("thakker.verify")
+
+MONEY_TOLERANCE = 0.01
+MAX_DIFFERENCES = 20
+LONG_DECIMAL = re.compile(r"-?\d+\.\d{3,}")
+
+
+def _text(values):
+    # Cells as text with missing values blank; long float renderings inside
+    # text (remarks built from float sums) are rounded to paise first.
+    text = values.astype(object).where(values.notna(), "").astype(str)
+    return text.str.replace(LONG_DECIMAL, lambda match: str(round(float(match.group()), 2)), regex=True).to_numpy()
+
+
+def _same(expected, actual, money, tolerance):
+    both_missing = expected.isna().to_numpy() & actual.isna().to_numpy()
+    same_text = _text(expected) == _text(actual)
+    if not money:
+        return both_missing | same_text
+    left = pd.to_numeric(expected, errors="coerce").to_numpy(dtype=float)
+    right = pd.to_numeric(actual, errors="coerce").to_numpy(dtype=float)
+    numeric = ~np.isnan(left) & ~np.isnan(right)
+    close = np.abs(np.where(numeric, left - right, 0)) <= tolerance + 1e-9
+    return both_missing | np.where(numeric, close, same_text)
+
+
+def frame_differences(expected, actual, money_columns=(), tolerance=MONEY_TOLERANCE, limit=MAX_DIFFERENCES):
+    # Cell by cell over the rows both frames have; money columns compare as
+    # numbers within tolerance. A column only one side has compares against
+    # blanks. Returns the number of differing cells and the first `limit` of
+    # them in row order.
+    rows = min(len(expected), len(actual))
+    total = 0
+    differences = []
+    if len(expected) != len(actual):
+        total += 1
+        differences.append({"row": None, "column": None, "expected": f"{len(expected)} rows", "actual": f"{len(actual)} rows"})
+    columns = list(expected.columns) + [column for column in actual.columns if column not in expected.columns]
+    blank = pd.Series(np.nan, index=pd.RangeIndex(rows), dtype=object)
+    for column in columns:
+        left = expected[column].iloc[:rows].reset_index(drop=True) if column in expected else blank
+        right = actual[column].iloc[:rows].reset_index(drop=True) if column in actual else blank
+        differing = np.flatnonzero(~_same(left, right, column in money_columns, tolerance))
+        total += len(differing)
+        differences += [
+            {"row": int(row), "column": column, "expected": left.iloc[row], "actual": right.iloc[row]}
+            for row in differing[:limit]
+        ]
+    differences.sort(key=lambda difference: -1 if difference["row"] is None else difference["row"])
+    return total, differences[:limit]
+
+
+class Verification:
+    # Outcome of running two engines on the same template: timings, row
+    # counts and the differences of the output and error frames.
+
+    def __init__(self, name, reference, candidate, seconds, frames, totals, differences):
+        self.name = name
+        self.reference = reference
+        self.candidate = candidate
+        self.seconds = seconds
+        self.frames = frames
+        self.totals = totals
+        self.differences = differences
+
+    @property
+    def ok(self):
+        return not any(self.totals.values())
+
+    @property
+    def difference_count(self):
+        return sum(self.totals.values())
+
+    def to_dict(self):
+        return {
+            "run": self.name,
+            "engines": [self.reference, self.candidate],
+            "seconds": {engine: round(seconds, 6) for engine, seconds in self.seconds.items()},
+            "rows": {engine: [len(df) for df in frames] for engine, frames in self.frames.items()},
+            "differences": dict(self.totals),
+            "first": {frame: [{key: str(value) for key, value in item.items()} for item in items]
+                      for frame, items in self.differences.items()},
+        }
+
+    def report(self):
+        lines = [
+            f"{self.name or 'run'}: {self.reference} {self.seconds[self.reference]:.3f}s, "
+            f"{self.candidate} {self.seconds[self.candidate]:.3f}s, "
+            + ("identical" if self.ok else f"{self.difference_count} differing cells")
+        ]
+        for frame, items in self.differences.items():
+            for item in items:
+                where = "row count" if item["row"] is None else f"row {item['row']}, {item['column']}"
+                lines.append(f"  {frame} {where}: {self.reference}={item['expected']!r} {self.candidate}={item['actual']!r}")
+        return "\n".join(lines)
+
+    def log(self):
+        logger.log(logging.INFO if self.ok else logging.WARNING, self.report(), extra={"verification": self.to_dict()})
+
+
+def verify(template, process_kwargs=None, reference="legacy", candidate=None, tolerance=MONEY_TOLERANCE,
+           limit=MAX_DIFFERENCES, name=""):
+    # Runs the candidate engine (the one in process_kwargs by default) on the
+    # template and the reference engine on a copy of it, so what the run
+    # leaves on the template (the rows it emitted, for the ledger) is the
+    # candidate's. The candidate is measured by the active RunStats like any
+    # run; the reference runs under its own, so counters are not doubled,
+    # but it still sees a cancel.
+    process_kwargs = dict(process_kwargs or {})
+    candidate = candidate or process_kwargs.pop("engine", None) or template.ENGINES[0]
+    process_kwargs.pop("engine", None)
+    seconds, frames = {}, {}
+
+    start = time.perf_counter()
+    frames[candidate] = template.process(engine=candidate, **process_kwargs)
+    seconds[candidate] = time.perf_counter() - start
+
+    shadow = RunStats(f"{name} {reference}".strip())
+    active = active_stats()
+    shadow.cancel_event = active.cancel_event if active is not None else None
+    start = time.perf_counter()
+    with shadow.activate():
+        frames[reference] = copy.copy(template).process(engine=reference, **process_kwargs)
+    seconds[reference] = time.perf_counter() - start
+
+    totals, differences = {}, {}
+    for frame, expected, actual in zip(("output", "errors"), frames[reference], frames[candidate]):
+        totals[frame], differences[frame] = frame_differences(expected, actual, template.MONEY_COLUMNS, tolerance, limit)
+    return Verification(name, reference, candidate, seconds, frames, totals, differences)
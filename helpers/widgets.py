@@ -0,0 +1,166 @@
+import math
+import time
+
+import streamlit as st
+
+from helpers.batch import record_pending, source_name
+from helpers.cache import PROCESSED_RESULTS, content_hash
+from helpers.exporter import EXPORT_FORMATS, exporter
+from helpers.jobs import start_job
+from helpers.utils import contains_text
+
+
+def download_button(label, result_key, sheets, export_format="xlsx", file_name=None, key=None, on_click=None):
+    # The file is only built when the button is clicked (and then memoized),
+    # so rendering the page does not serialize anything. on_click runs when
+    # the file is downloaded.
+    export = EXPORT_FORMATS[export_format]
+    st.download_button(
+        label=label,
+        data=exporter(result_key, sheets, export_format),
+        file_name=file_name or f"{sheets[0][0].lower()}.{export.extension}",
+        mime=export.mime,
+        key=key,
+        on_click=on_click,
+    )
+
+
+def export_options(result_key, output_df, error_df, file_stem="processed_output", on_click=None):
+    sheets = (("Output", output_df), ("Errors", error_df))
+    export_format = st.selectbox(
+        "Other export formats",
+        [name for name in EXPORT_FORMATS if name != "xlsx"],
+        format_func=lambda name: EXPORT_FORMATS[name].label,
+        key=f"export_format_{file_stem}",
+    )
+    export = EXPORT_FORMATS[export_format]
+    download_button(
+        f"Download {export.label}",
+        result_key,
+        sheets if export.both_sheets else sheets[:1],
+        export_format,
+        file_name=f"{file_stem}.{export.extension}",
+        key=f"export_{file_stem}",
+        on_click=on_click,
+    )
+
+
+PREVIEW_ROWS = 100
+
+
+def frame_preview(df, key, search=None, page_size=PREVIEW_ROWS):
+    # Sends one page of rows to the browser; the full frame only leaves
+    # through the downloads. Search runs on the server: search(df, query)
+    # returns the mask of matching rows, any column matching by default.
+    query = st.text_input("Search by order id", key=f"{key}_search").strip()
+    if query:
+        df = df[search(df, query) if search else contains_text(df, query)]
+    pages = max(math.ceil(len(df) / page_size), 1)
+    page = st.number_input(f"Page (of {pages:,})", 1, pages, 1, key=f"{key}_page") if pages > 1 else 1
+    start = (page - 1) * page_size
+    st.dataframe(df.iloc[start:start + page_size])
+    shown = f"Rows {start + 1:,}-{min(start + page_size, len(df)):,} of {len(df):,}" if len(df) else "No rows"
+    st.caption(f"{shown} matching '{query}'" if query else shown)
+
+
+def summary_panel(summary):
+    metrics = summary.get("metrics", {})
+    for column, (label, value) in zip(st.columns(len(metrics) or 1), metrics.items()):
+        column.metric(label, f"{value:,.2f}" if isinstance(value, float) else f"{value:,}")
+    for label, table in summary.get("tables", {}).items():
+        if len(table):
+            st.write(f"{label}:")
+            st.dataframe(table, hide_index=True)
+
+
+def run_stats_panel(stats):
+    with st.expander("Run stats"):
+        st.write("Stages (seconds):")
+        st.dataframe(stats.stage_frame(), hide_index=True)
+        st.write("Counts:")
+        st.dataframe(stats.counter_frame(), hide_index=True)
+        if stats.tracing:
+            st.write("Per-order totals:")
+            st.dataframe(stats.trace_frame(), hide_index=True)
+
+
+def keep_processed(ledger, kind, pending):
+    # What the output downloads run with "New orders only": the rows of the
+    # run go into the ledger once its output has been downloaded, not when
+    # it is computed, so a rerun before that still gets them.
+    if ledger is None:
+        return None
+    st.caption("The orders of this run are remembered as processed once the output is downloaded.")
+    return lambda: record_pending(ledger, kind, pending)
+
+
+def reference_uploader(label, info):
+    # A reference file already in the store only has to be uploaded again
+    # when it changes.
+    if info is None:
+        return st.file_uploader(label, type=["xlsx", "xls"])
+    stored_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(info["stored_at"]))
+    return st.file_uploader(
+        f"{label} (optional: using the stored {info['file_name']}, {info['rows']} rows, from {stored_at})",
+        type=["xlsx", "xls"],
+    )
+
+
+def make_current_button(store, name, label, file, store_file):
+    # An uploaded reference file is used by this session only. Making it the
+    # stored one that every session without an upload uses is explicit.
+    if file is None or content_hash(file) == store.current_version(name):
+        return
+    if st.button(f"Use {source_name(file)} as the stored {label} for every session", key=f"make_current_{name}"):
+        store_file()
+        store.set_current(name, content_hash(file))
+        st.rerun()
+
+
+def background_result(session_key, result_key, run, total_files, label="Processing"):
+    # Runs run(job) as a background job of this session and returns its
+    # result once finished, None until then. Widget interactions rerun the
+    # page without restarting the job; new inputs cancel it and start over.
+    result = PROCESSED_RESULTS.get(result_key)
+    if result is not None:
+        return result
+
+    job = st.session_state.get(session_key)
+    if job is None or job.key != result_key:
+        if job is not None:
+            job.cancel()
+        job = start_job(label, run, total_files, result_key)
+        st.session_state[session_key] = job
+
+    if job.status == "done":
+        return PROCESSED_RESULTS.put(result_key, job.result())
+    if job.status == "failed":
+        job.result()
+    if job.status == "cancelled":
+        st.warning("Processing was cancelled.")
+        if st.button("Process again", key=f"{session_key}_restart"):
+            del st.session_state[session_key]
+            st.rerun()
+        return None
+
+    job_progress(session_key, label)
+    return None
+
+
+@st.fragment(run_every=0.5)
+def job_progress(session_key, label):
+    job = st.session_state.get(session_key)
+    if job is None:
+        return
+    if job.done:
+        st.rerun()
+    progress = job.progress()
+    if progress["rows_total"]:
+        text = f"{label}: {progress['rows_done']:,} / {progress['rows_total']:,} rows, {progress['rows_per_second']:,.0f} rows/s"
+    else:
+        text = f"{label}: reading files ({progress['seconds']:.0f}s)"
+    st.progress(progress["fraction"], text=text)
+    if job.cancelled:
+        st.caption("Cancelling...")
+    elif st.button("Cancel", key=f"{session_key}_cancel"):
+        job.cancel()
@@ -1,7 +1,13 @@
 import streamlit as st
-import io
-import pandas as pd
 from templates.PaymentStatementTemplate import PaymentStatementTemplate
+from helpers.batch import process_files
+from helpers.cache import PROCESSED_RESULTS, result_key
+from helpers.reference_store import shared_store
+from helpers.ledger import shared_ledger
+from helpers.widgets import (
+    background_result, download_button, export_options, frame_preview, keep_processed, make_current_button,
+    reference_uploader, run_stats_panel, summary_panel,
+)
 
 class PaymentStatement :
 
@@ -13,41 +19,72 @@ class PaymentStatement :
 
         expense = st.text_area("Expense", value="Promo rebates,Product tax discount")
 
-        payment_statement = st.file_uploader("Upload Payment Statement", type=["xlsx", "xls"])
+        payment_statements = st.file_uploader("Upload Payment Statements", type=["xlsx", "xls"], accept_multiple_files=True)
         sale_register = st.file_uploader("Upload Sale Register", type=["xlsx", "xls"])
-        matching_template = st.file_uploader("Upload Matching Template", type=["xlsx", "xls"])
+        store = shared_store()
+        matching_template = reference_uploader("Upload Matching Template", store.info("matching_template"))
+        make_current_button(store, "matching_template", "Matching Template", matching_template,
+                            lambda: PaymentStatementTemplate.store_reference(store, matching_template))
+        trace = st.checkbox("Trace each order")
+        new_only = st.checkbox("New orders only", help="Skip orders processed in earlier runs; the new ones are remembered once their output is downloaded")
+        shadow = st.checkbox("Shadow check", help="Also run the legacy engine and count the cells where it differs (slow)")
 
-        if payment_statement and sale_register and matching_template:
-            processor = PaymentStatementTemplate(payment_statement, sale_register, matching_template)
-            [output_df, error_df] = processor.process(template_option, expense)
+        versions = store.resolve(PaymentStatementTemplate.STORED_REFERENCES, [matching_template])
+
+        if payment_statements and sale_register and all(versions):
+            key = result_key(
+                "payment_statement", payment_statements + [sale_register], versions, template_option, expense,
+                trace, new_only, shadow,
+            )
+
+            ledger = shared_ledger() if new_only else None
+
+            def run(job):
+                reference = PROCESSED_RESULTS.get_or_compute(
+                    result_key("payment_statement_reference", [sale_register], versions),
+                    lambda: PaymentStatementTemplate.from_reference(sale_register, matching_template, store=store),
+                )
+                return process_files(
+                    reference, payment_statements, {"order_type": template_option, "expense": expense},
+                    trace=trace, name="payment_statement", ledger=ledger, job=job,
+                    shadow=shadow,
+                )
+
+            result = background_result("payment_statement_job", key, run, len(payment_statements))
+            if result is None:
+                return
+            [output_df, error_df, status_df, stats, pending] = result
+            keep = keep_processed(ledger, PaymentStatementTemplate.LEDGER_KIND, pending)
+
+            st.write("Files:")
+            st.dataframe(status_df, hide_index=True)
+
+            run_stats_panel(stats)
+
+            summary_panel(PROCESSED_RESULTS.get_or_compute(key + ("summary",), lambda: PaymentStatementTemplate.summarize(output_df, error_df)))
 
             st.write("Processed Data:")
-            st.dataframe(output_df)
+            frame_preview(output_df, "payment_statement_output", PaymentStatementTemplate.order_mask)
 
-            output_buffer = io.BytesIO()
-            output_df.to_excel(output_buffer, index=False)
-            output_buffer.seek(0)
+            download_button("Download Processed Excel File", key, (("Output", output_df),), file_name="processed_output.xlsx",
+                            on_click=keep)
 
-            st.download_button(
-                label="Download Processed Excel File",
-                data=output_buffer,
-                file_name="processed_output.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            st.write("Journal Balance:")
+            balance = PROCESSED_RESULTS.get_or_compute(
+                key + ("balance",), lambda: PaymentStatementTemplate.balance_issues(output_df)
             )
+            if balance.empty:
+                st.success("Every journal entry has an Entry Type row, balances and has an account on each line")
+            else:
+                st.warning(f"{len(balance)} journal entries are unbalanced, have lines without an account or have no Entry Type row")
+                frame_preview(balance, "payment_statement_balance")
 
             st.write("Error Data:")
-            st.dataframe(error_df)
+            frame_preview(error_df, "payment_statement_errors")
 
-            output_buffer = io.BytesIO()
-            error_df.to_excel(output_buffer, index=False)
-            output_buffer.seek(0)
+            download_button("Download Error Excel File", key, (("Errors", error_df),), file_name="errors.xlsx")
 
-            st.download_button(
-                label="Download Error Excel File",
-                data=output_buffer,
-                file_name="errors.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            export_options(key, output_df, error_df, on_click=keep)
 
 def main():
     PaymentStatement().setUI()
@@ -1,7 +1,13 @@
 import streamlit as st
-import io
-import pandas as pd
 from templates.SaleOrderTemplate import SaleOrderTemplate
+from helpers.batch import process_files
+from helpers.cache import PROCESSED_RESULTS, result_key
+from helpers.reference_store import shared_store
+from helpers.ledger import shared_ledger
+from helpers.widgets import (
+    background_result, download_button, export_options, frame_preview, keep_processed, make_current_button,
+    reference_uploader, run_stats_panel, summary_panel,
+)
 
 class SaleOrder :
 
@@ -9,41 +15,62 @@ class SaleOrder :
         
         st.title("Sale order template")
 
-        amazon_file = st.file_uploader("Upload Amazon Sale Order Template", type=["xlsx", "xls"])
-        cp_file = st.file_uploader("Upload CP Item List", type=["xlsx", "xls"])
-        product_bundle_file = st.file_uploader("Upload Product Bundle File", type=["xlsx", "xls"])
+        amazon_files = st.file_uploader("Upload Amazon Sale Order Templates", type=["xlsx", "xls"], accept_multiple_files=True)
+        store = shared_store()
+        cp_file = reference_uploader("Upload CP Item List", store.info("cp_items"))
+        product_bundle_file = reference_uploader("Upload Product Bundle File", store.info("product_bundles"))
+        make_current_button(store, "cp_items", "CP Item List", cp_file,
+                            lambda: SaleOrderTemplate.store_reference(store, cp_file=cp_file))
+        make_current_button(store, "product_bundles", "Product Bundle", product_bundle_file,
+                            lambda: SaleOrderTemplate.store_reference(store, product_bundle_file=product_bundle_file))
+        pack_sizes = st.checkbox("Stock rate per pack piece", help="Divide stock UOM rates by the '(Pack of N)' in the item name")
+        trace = st.checkbox("Trace each order")
+        new_only = st.checkbox("New orders only", help="Skip orders processed in earlier runs; the new ones are remembered once their output is downloaded")
+        shadow = st.checkbox("Shadow check", help="Also run the legacy engine and count the cells where it differs (slow)")
 
-        if amazon_file and cp_file and product_bundle_file:
-            processor = SaleOrderTemplate(amazon_file, cp_file, product_bundle_file)
-            [output_df, error_df] = processor.process()
+        reference_files = [cp_file, product_bundle_file]
+        versions = store.resolve(SaleOrderTemplate.STORED_REFERENCES, reference_files)
 
-            st.write("Processed Data:")
-            st.dataframe(output_df)
+        if amazon_files and all(versions):
+            key = result_key("sale_order", amazon_files, versions, pack_sizes, trace, new_only, shadow)
+
+            ledger = shared_ledger() if new_only else None
+
+            def run(job):
+                reference = PROCESSED_RESULTS.get_or_compute(
+                    ("sale_order_reference",) + versions,
+                    lambda: SaleOrderTemplate.from_reference(*reference_files, store=store),
+                )
+                return process_files(
+                    reference, amazon_files, {"pack_sizes": pack_sizes}, trace=trace, name="sale_order",
+                    ledger=ledger, job=job, shadow=shadow,
+                )
+
+            result = background_result("sale_order_job", key, run, len(amazon_files))
+            if result is None:
+                return
+            [output_df, error_df, status_df, stats, pending] = result
+            keep = keep_processed(ledger, SaleOrderTemplate.LEDGER_KIND, pending)
+
+            st.write("Files:")
+            st.dataframe(status_df, hide_index=True)
 
-            output_buffer = io.BytesIO()
-            output_df.to_excel(output_buffer, index=False)
-            output_buffer.seek(0)
+            run_stats_panel(stats)
 
-            st.download_button(
-                label="Download Processed Excel File",
-                data=output_buffer,
-                file_name="processed_output.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            summary_panel(PROCESSED_RESULTS.get_or_compute(key + ("summary",), lambda: SaleOrderTemplate.summarize(output_df, error_df)))
+
+            st.write("Processed Data:")
+            frame_preview(output_df, "sale_order_output", SaleOrderTemplate.order_mask)
+
+            download_button("Download Processed Excel File", key, (("Output", output_df),), file_name="processed_output.xlsx",
+                            on_click=keep)
 
             st.write("Error Data:")
-            st.dataframe(error_df)
-
-            output_buffer = io.BytesIO()
-            error_df.to_excel(output_buffer, index=False)
-            output_buffer.seek(0)
-
-            st.download_button(
-                label="Download Error Excel File",
-                data=output_buffer,
-                file_name="errors.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            frame_preview(error_df, "sale_order_errors")
+
+            download_button("Download Error Excel File", key, (("Errors", error_df),), file_name="errors.xlsx")
+
+            export_options(key, output_df, error_df, on_click=keep)
 
 def main():
     SaleOrder().setUI()
@@ -1,27 +1,111 @@
+import copy
+from concurrent.futures import as_completed
 import pandas as pd
-import re
 from datetime import datetime
-from helpers.utils import extract_pack_of_quantity, calculate_price_per_packet, format_state
+import numpy as np
+from helpers.utils import contains_text, normalize_dates, extract_pack_of_quantity, calculate_price_per_packet, format_state, map_unique, to_paise, to_rupees, round_to_rupee, group_sum
 from helpers.file_handler import FileHandler
+from helpers.cache import content_hash
+from helpers import batch
+from helpers.batch import source_name
+from helpers.ledger import line_keys
+from helpers.instrumentation import PROGRESS_ROWS, RunStats, count, count_errors, progress, stage, start_stage, trace, tracing
+from helpers.schema import Column, OutputSchema
 
 class Constants:
     SERIES_FORMAT = "ACC-JV-.YYYY.-"
-    ACCOUNT_27_COD = "1604 - Amazon COD Fund - TMPL"
-    ACCOUNT_29_COD = "1604 - Amazon COD Fund - TMPL29"
-    ACCOUNT_27_ELECTRONIC = "1601 - Amazon Electronic Fund - TMPL"
-    ACCOUNT_29_ELECTRONIC = "1601 - Amazon Electronic Fund - TMPL29"
     CREDITORS = ["Creditors (INR) - TMPL", "Creditors (INR) - TMPL29"]
     DEBTORS = ["Debtors (INR) - TMPL", "Debtors (INR) - TMPL29"]
 
+    # Matching template column with each company's account per amount
+    # description, by the GSTIN state code the company is registered under. A
+    # GSTIN starting with any other code resolves to no account.
+    ERP_COMPANY_COLUMNS = {"27": "ERP 27 Company", "29": "ERP 29 Company"}
+    STATE_CODES = list(ERP_COMPANY_COLUMNS)
+
+    # Ledger account for each (GSTIN state code, order type, entry role).
+    # Contra entries for reserve and null-order lines are always booked in the
+    # 27 company. Supporting a new state or order type is a matter of adding
+    # rows here and a column above.
+    ACCOUNTS = {
+        ("27", "COD_", "fund"): "1604 - Amazon COD Fund - TMPL",
+        ("29", "COD_", "fund"): "1604 - Amazon COD Fund - TMPL29",
+        ("27", "Electronic_", "fund"): "1601 - Amazon Electronic Fund - TMPL",
+        ("29", "Electronic_", "fund"): "1601 - Amazon Electronic Fund - TMPL29",
+        ("27", "COD_", "round off"): "Rounded Off - TMPL",
+        ("29", "COD_", "round off"): "Rounded Off - TMPL29",
+        ("27", "Electronic_", "round off"): "Rounded Off - TMPL",
+        ("29", "Electronic_", "round off"): "Rounded Off - TMPL29",
+        ("27", "COD_", "reserve fund"): "1604 - Amazon COD Fund - TMPL",
+        ("27", "COD_", "freeze fund"): "1603 - Amazon Freeze Fund - COD - TMPL",
+        ("27", "Electronic_", "reserve fund"): "1601 - Amazon Electronic Fund - TMPL",
+        ("27", "Electronic_", "freeze fund"): "1602 - Amazon Freeze Fund - Electronic - TMPL",
+        ("27", "COD_", "null order fund"): "1603 - Amazon Freeze Fund - COD - TMPL",
+        ("27", "Electronic_", "null order fund"): "1601 - Amazon Electronic Fund - TMPL",
+    }
+
 def parse_date(date_str, input_format="%d.%m.%Y %H:%M:%S %Z", output_format="%Y/%m/%d"):
     return datetime.strptime(date_str, input_format).strftime(output_format)
 
-def get_accounting_entry(company_gstin, match_template):
-    if re.match(r"^27\d*", company_gstin):
-        return match_template.iloc[0]["ERP 27 Company"]
-    elif re.match(r"^29\d*", company_gstin):
-        return match_template.iloc[0]["ERP 29 Company"]
-    return "" 
+def gstin_state_code(company_gstin):
+    state = str(company_gstin)[:2]
+    return state if state in Constants.STATE_CODES else ""
+
+def state_codes(gstins):
+    return pd.Categorical(pd.Series(gstins, dtype=object).astype(str).str[:2], categories=Constants.STATE_CODES)
+
+def account_for(state, order_type, role):
+    return Constants.ACCOUNTS.get((state, order_type, role), "")
+
+def account_table(order_type):
+    # Accounts for one order type: a row per state code in category order,
+    # a column per role, plus a trailing row of blanks that category code -1
+    # (an unknown state) picks up.
+    roles = sorted({role for _, _, role in Constants.ACCOUNTS})
+    rows = [[account_for(state, order_type, role) for role in roles] for state in Constants.STATE_CODES + [""]]
+    return pd.DataFrame(rows, columns=roles)
+
+def group_cumsum(flags, codes):
+    return pd.Series(flags.astype(np.int64)).groupby(codes).cumsum().to_numpy()
+
+def journal_block(position, seq, columns):
+    block = pd.DataFrame(columns, index=pd.RangeIndex(len(position)))
+    block["_pos"] = position
+    block["_seq"] = seq
+    return block
+
+def assemble_blocks(blocks, schema):
+    blocks = [block for block in blocks if len(block)]
+    if not blocks:
+        return schema.build({})
+    # Blocks go in the order their first row lands, which the stable sort
+    # keeps for rows sharing a (_pos, _seq); the schema sets the columns.
+    blocks.sort(key=lambda block: (block["_pos"].iloc[0], block["_seq"].iloc[0]))
+    frame = pd.concat(blocks, ignore_index=True, sort=False)
+    frame = frame.sort_values(["_pos", "_seq"], kind="stable")
+    return schema.conform(frame.reset_index(drop=True))
+
+def order_chunks(order_ids, chunk_rows):
+    # Row ranges of about chunk_rows lines each that never split an order;
+    # lines without an order id may go to any chunk.
+    order_ids = pd.Series(order_ids, dtype=object)
+    starts = np.flatnonzero((order_ids != order_ids.shift()).to_numpy() | order_ids.isna().to_numpy())
+    cuts = np.unique(starts[np.minimum(np.searchsorted(starts, np.arange(chunk_rows, len(order_ids), chunk_rows)), len(starts) - 1)])
+    bounds = np.r_[0, cuts[cuts > 0], len(order_ids)]
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def partition_blocks(template, lines, position, order_type, expense, settlement_start_date, settlement_end_date, traced):
+    # Runs in a partition worker; traces are handed back with the blocks.
+    stats = RunStats(trace=traced)
+    with stats.activate():
+        blocks = template._journal_blocks(
+            lines, order_type, expense, settlement_start_date, settlement_end_date, position
+        )
+    return blocks, stats.traces
+
+def get_accounting_entry(company_gstin, accounts):
+    state = gstin_state_code(company_gstin)
+    return accounts[Constants.STATE_CODES.index(state)] if state else ""
 
 class PaymentStatementTemplate:
 
@@ -46,27 +130,449 @@ class PaymentStatementTemplate:
         "Company",
     }
 
-    REQUIRED_MATCHING_TEMPLATE_COLUMNS = {
-        "amount-description",
-        "ERP 27 Company",
-        "ERP 29 Company",
+    REQUIRED_MATCHING_TEMPLATE_COLUMNS = {"amount-description", *Constants.ERP_COMPANY_COLUMNS.values()}
+
+    RESERVE_DESCRIPTIONS = ["Current Reserve Amount", "Previous Reserve Amount Balance"]
+    NULL_ORDER_AMOUNT_TYPES = ["Cost of Advertising", "Amazon Business Advisory Fee"]
+
+    ENGINES = ("groupby", "partitioned", "legacy")
+    MONEY_COLUMNS = ("Debit (Accounting Entries)", "Credit (Accounting Entries)")
+    STREAM_ROWS = 50000
+    PARTITION_ROWS = 20000
+
+    # Journal Entry import layout; every column is filled by the engines
+    # under its own name. Each error row fills one of the error columns.
+    JOURNAL_SCHEMA = OutputSchema([
+        Column("Company"),
+        Column("Entry Type"),
+        Column("Posting Date"),
+        Column("Series"),
+        Column("Reference Date"),
+        Column("Reference Number"),
+        Column("User Remark"),
+        Column("Company GSTIN"),
+        Column("Account (Accounting Entries)"),
+        Column("Cost Center (Accounting Entries)"),
+        Column("Debit (Accounting Entries)", dtype=float),
+        Column("Credit (Accounting Entries)", dtype=float),
+        Column("Party (Accounting Entries)"),
+        Column("Party Type (Accounting Entries)"),
+        Column("Reference Name (Accounting Entries)"),
+        Column("Reference Type (Accounting Entries)"),
+        Column("User Remark (Accounting Entries)"),
+    ])
+    ERROR_SCHEMA = OutputSchema([
+        Column("Posting Date"),
+        Column("Reference Number"),
+        Column("Account (Accounting Entries)"),
+        Column("Reference Date"),
+        Column("Credit (Accounting Entries)"),
+    ])
+
+    LEDGER_KIND = "payment_statement"
+    STORED_REFERENCES = ("matching_template",)
+    LEDGER_KEY_COLUMNS = ["order-id", "amount-type", "amount-description", "amount", "posted-date"]
+    # Ledger keys of the statement as first given, and the orders the last
+    # run reported as a whole instead of journalling them.
+    input_keys = None
+    reported_orders = frozenset()
+
+    NO_PRINCIPAL_ERROR = "Error: No Principal line for "
+
+    SALE_REGISTER_FIELDS = [
+        "Company GSTIN",
+        "Customer Name",
+        "Voucher",
+        "Voucher Type",
+        "Posting Date",
+        "Cost Center",
+        "Company",
+    ]
+
+    PAYMENT_DTYPES = {
+        "settlement-start-date": str,
+        "settlement-end-date": str,
+        "order-id": str,
+        "amount": float,
+        "posted-date": str,
+        "amount-description": str,
+        "amount-type": str,
     }
 
+    SALE_REGISTER_DTYPES = {
+        "Customer's Purchase Order": str,
+        "Company GSTIN": str,
+        "Customer Name": str,
+        "Voucher": str,
+        "Voucher Type": str,
+        "Cost Center": str,
+        "Company": str,
+    }
+
+    MATCHING_TEMPLATE_DTYPES = {"amount-description": str, **{column: str for column in Constants.ERP_COMPANY_COLUMNS.values()}}
+
     def __init__(self, payment_statement_file, sale_register_file, matching_template_file):
-        self.payment_statement = FileHandler.read_excel(payment_statement_file)
-        self.sale_register = FileHandler.read_excel(sale_register_file)
-        self.matching_template = FileHandler.read_excel(matching_template_file)
-        for df in [self.payment_statement, self.sale_register, self.matching_template]:
-            df.columns = df.columns.str.strip()
-            
-        FileHandler.validate_columns(self.payment_statement, self.REQUIRED_PAYMENT_COLUMNS, "Payment Statement")
-        FileHandler.validate_columns(self.sale_register, self.REQUIRED_SALE_REGISTER_COLUMNS, "Sale Register")
-        FileHandler.validate_columns(self.matching_template, self.REQUIRED_MATCHING_TEMPLATE_COLUMNS, "Matching Template")
+        self.payment_statement, self.sale_register, self.matching_template = FileHandler.read_many([
+            self.input_read(payment_statement_file),
+            self.sale_register_read(sale_register_file),
+            self.matching_template_read(matching_template_file),
+        ])
+
+        self._build_lookups()
+
+    @classmethod
+    def input_read(cls, payment_statement_file):
+        return {
+            "file": payment_statement_file,
+            "required_columns": cls.REQUIRED_PAYMENT_COLUMNS,
+            "dtypes": cls.PAYMENT_DTYPES,
+            "file_name": "Payment Statement",
+        }
+
+    @classmethod
+    def sale_register_read(cls, sale_register_file):
+        return {
+            "file": sale_register_file,
+            "required_columns": cls.REQUIRED_SALE_REGISTER_COLUMNS,
+            "dtypes": cls.SALE_REGISTER_DTYPES,
+            "file_name": "Sale Register",
+        }
+
+    @classmethod
+    def matching_template_read(cls, matching_template_file):
+        return {
+            "file": matching_template_file,
+            "required_columns": cls.REQUIRED_MATCHING_TEMPLATE_COLUMNS,
+            "dtypes": cls.MATCHING_TEMPLATE_DTYPES,
+            "file_name": "Matching Template",
+        }
+
+    @classmethod
+    def reference_reads(cls, sale_register_file, matching_template_file=None):
+        reads = [cls.sale_register_read(sale_register_file), cls.matching_template_read(matching_template_file)]
+        return [read for read in reads if read["file"] is not None]
+
+    @classmethod
+    def read_input(cls, payment_statement_file, use_cache=True):
+        return FileHandler.read_columns(**cls.input_read(payment_statement_file), use_cache=use_cache)
+
+    @classmethod
+    def from_frames(cls, payment_statement, sale_register, matching_template):
+        template = cls.__new__(cls)
+        template.sale_register = sale_register
+        template.matching_template = matching_template
+        FileHandler.validate_columns(sale_register, cls.REQUIRED_SALE_REGISTER_COLUMNS, "Sale Register")
+        FileHandler.validate_columns(matching_template, cls.REQUIRED_MATCHING_TEMPLATE_COLUMNS, "Matching Template")
+        template._build_lookups()
+        template.payment_statement = None
+        return template.with_input(payment_statement) if payment_statement is not None else template
+
+    @classmethod
+    def from_reference(cls, sale_register_file, matching_template_file=None, store=None):
+        # A template holding only the reference data and its lookups; give it
+        # a statement with with_input() before processing. With a store, an
+        # uploaded matching template is stored and used, and a missing one is
+        # loaded at the current version; the sale register is always uploaded.
+        if store is not None:
+            cls.store_reference(store, matching_template_file)
+            [version] = store.resolve(cls.STORED_REFERENCES, [matching_template_file])
+            matching_template = store.load(
+                "matching_template", version, dtypes=cls.MATCHING_TEMPLATE_DTYPES, label="Matching Template"
+            )
+            return cls.from_frames(None, cls.read_sale_register(sale_register_file), matching_template)
+        sale_register, matching_template = FileHandler.read_many([
+            cls.sale_register_read(sale_register_file), cls.matching_template_read(matching_template_file)
+        ])
+        return cls.from_frames(None, sale_register, matching_template)
+
+    @classmethod
+    def read_sale_register(cls, sale_register_file):
+        return FileHandler.read_columns(**cls.sale_register_read(sale_register_file))
+
+    @classmethod
+    def read_matching_template(cls, matching_template_file):
+        return FileHandler.read_columns(**cls.matching_template_read(matching_template_file))
+
+    @classmethod
+    def store_reference(cls, store, matching_template_file=None):
+        if matching_template_file is not None:
+            store.put(
+                "matching_template", cls.read_matching_template(matching_template_file),
+                content_hash(matching_template_file), ["amount-description"], source_name(matching_template_file)
+            )
+
+    def with_input(self, payment_statement):
+        FileHandler.validate_columns(payment_statement, self.REQUIRED_PAYMENT_COLUMNS, "Payment Statement")
+        template = copy.copy(self)
+        template.payment_statement = payment_statement
+        template.input_keys = None
+        template.reported_orders = frozenset()
+        return template
+
+    def _build_lookups(self):
+        with stage("lookup"):
+            self._index_reference()
+
+    def _index_reference(self):
+        # Keyed on the first row per purchase order / amount-description, which
+        # is the row the per-line filters used to pick with .iloc[0].
+        register = (
+            self.sale_register
+            .dropna(subset=["Customer's Purchase Order"])
+            .drop_duplicates("Customer's Purchase Order", keep="first")
+        )
+        self.sale_register_index = register.set_index("Customer's Purchase Order")[self.SALE_REGISTER_FIELDS]
+        self.sale_register_index["Reference Date"], _ = normalize_dates(
+            self.sale_register_index["Posting Date"], "%Y-%m-%d %H:%M:%S"
+        )
+        self.sale_register_index["State Code"] = state_codes(self.sale_register_index["Company GSTIN"])
+        self.sale_register_lookup = self.sale_register_index.to_dict("index")
+
+        templates = (
+            self.matching_template
+            .dropna(subset=["amount-description"])
+            .drop_duplicates("amount-description", keep="first")
+        )
+        self.account_index = templates.set_index("amount-description")[list(Constants.ERP_COMPANY_COLUMNS.values())]
+        self.account_map = dict(zip(self.account_index.index, self.account_index.itertuples(index=False, name=None)))
+
+    def ledger_keys(self):
+        # new_only keeps the keys of the full statement, so the occurrence
+        # numbers of repeated lines do not shift when lines are dropped.
+        if self.input_keys is not None:
+            return self.input_keys
+        return line_keys(self.payment_statement.iloc[1:], self.LEDGER_KEY_COLUMNS)
+
+    def new_only(self, ledger):
+        # Drops statement lines the ledger already has; the first line only
+        # carries the settlement period and is always kept.
+        keys = self.ledger_keys()
+        known = ledger.known(self.LEDGER_KIND, keys)
+        count("rows skipped", int(known.sum()))
+        if not known.any():
+            return self
+        keep = np.concatenate([[True], ~known])
+        template = self.with_input(self.payment_statement[keep].reset_index(drop=True))
+        template.input_keys = keys[~known]
+        return template
+
+    def processed_keys(self):
+        # A line counts as processed once its order is in the sale register
+        # with a valid date and the run journalled it, which is what gets it a
+        # journal entry; lines without an order need a valid posted date.
+        # Everything else is reported as an error and tried again next time.
+        lines = self.payment_statement.iloc[1:]
+        _, invalid = normalize_dates(lines["posted-date"], "%d.%m.%Y")
+        registered = self.sale_register_index["Reference Date"].dropna().index
+        journalled = lines["order-id"].isin(registered) & ~lines["order-id"].isin(self.reported_orders)
+        emitted = ~invalid & (lines["order-id"].isna() | journalled).to_numpy()
+        return self.ledger_keys()[emitted]
+
+    def record_processed(self, ledger, run=""):
+        recorded = ledger.record(self.LEDGER_KIND, self.processed_keys(), run)
+        count("lines recorded", recorded)
+        return recorded
+
+    def process(self, order_type, expense, engine="groupby"):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of: {', '.join(self.ENGINES)}")
+        count("rows in", len(self.payment_statement))
+        if engine == "groupby":
+            output_df, error_df = self._process_groupby(order_type, expense)
+        elif engine == "partitioned":
+            output_df, error_df = self._process_groupby(order_type, expense, batch.PARTITION_WORKERS)
+        else:
+            output_df, error_df = self._process_legacy(order_type, expense)
+        self.reported_orders = frozenset()
+        return self._counted(output_df, error_df)
+
+    def stream(self, order_type, expense, engine="groupby", chunk_rows=None):
+        # The groupby engine run over chunks of whole orders in one pass,
+        # yielding (journal, errors) frames as each chunk is done; the null
+        # order contra entries close the stream. Concatenated, the chunks are
+        # what process() returns, but only one chunk of output exists at a
+        # time, so a sink can take the rows as they come.
+        if engine != "groupby":
+            raise ValueError("Streaming needs the groupby engine")
+        count("rows in", len(self.payment_statement))
+        payment_statement, settlement_start_date, settlement_end_date, date_errors = self._prepare_statement()
+        expense = expense.split(",")
+        self.reported_orders = frozenset()
+        yield self._counted(self.JOURNAL_SCHEMA.build({}), self.ERROR_SCHEMA.from_records(date_errors))
+        for start, end in order_chunks(payment_statement["order-id"], chunk_rows or self.STREAM_ROWS):
+            chunk = payment_statement.iloc[start:end]
+            with stage("journal build"):
+                output_blocks, error_blocks = self._journal_blocks(
+                    chunk, order_type, expense, settlement_start_date, settlement_end_date
+                )
+            progress(len(chunk))
+            with stage("assemble"):
+                yield self._counted(assemble_blocks(output_blocks, self.JOURNAL_SCHEMA), assemble_blocks(error_blocks, self.ERROR_SCHEMA))
+        with stage("null-order grouping"):
+            output_blocks = self._null_order_blocks(payment_statement, order_type, settlement_start_date, settlement_end_date, 0)
+        yield self._counted(assemble_blocks(output_blocks, self.JOURNAL_SCHEMA), self.ERROR_SCHEMA.build({}))
+
+    def _counted(self, output_df, error_df):
+        # Counts a finished part of the output and notes its orders that were
+        # reported as a whole.
+        count("rows out", len(output_df))
+        count_errors(self.error_categories(error_df))
+        if "Reference Number" in error_df:
+            reference = error_df["Reference Number"].dropna().astype(str)
+            reported = reference[reference.str.startswith(self.NO_PRINCIPAL_ERROR)].str.slice(len(self.NO_PRINCIPAL_ERROR))
+            self.reported_orders = self.reported_orders | frozenset(reported)
+        return output_df, error_df
+
+    @classmethod
+    def error_categories(cls, error_df):
+        # Every error row fills exactly one column, which tells its kind; the
+        # two kinds of order reference error are told apart by their text.
+        columns = {
+            "Reference Number": "no purchase order",
+            "Account (Accounting Entries)": "no account match",
+            "Credit (Accounting Entries)": "unbalanced order",
+            "Posting Date": "invalid posted date",
+            "Reference Date": "invalid register date",
+        }
+        categories = {category: int(error_df[column].notna().sum()) for column, category in columns.items() if column in error_df}
+        if "Reference Number" in error_df:
+            reference = error_df["Reference Number"].astype(object).fillna("").astype(str)
+            categories["no principal line"] = int(reference.str.startswith(cls.NO_PRINCIPAL_ERROR).sum())
+            categories["no purchase order"] -= categories["no principal line"]
+        return categories
 
+    @staticmethod
+    def balance_issues(output_df):
+        # Post-pass over a journal: an entry runs from one Entry Type row to
+        # the next (and never across source files), debits and credits are
+        # summed per entry in paise, and entries that do not balance, have
+        # lines without an account or have no Entry Type row come back, one
+        # row each. A journal without an Entry Type column is all headless.
+        debit, credit = "Debit (Accounting Entries)", "Credit (Accounting Entries)"
+        columns = [
+            "Entry", "First Row", "Entry Type", "Reference Number", "Posting Date", "Lines",
+            "Debit", "Credit", "Difference", "Lines Without Account", "Issue",
+        ]
+        if output_df.empty:
+            return pd.DataFrame(columns=columns)
+        if "Entry Type" in output_df:
+            headed = output_df["Entry Type"].notna().to_numpy()
+        else:
+            headed = np.zeros(len(output_df), dtype=bool)
+        starts = headed.copy()
+        if batch.SOURCE_COLUMN in output_df:
+            source = output_df[batch.SOURCE_COLUMN]
+            starts |= (source != source.shift()).to_numpy()
+        starts[0] = True
+        entry = np.cumsum(starts) - 1
+        entries = int(entry[-1]) + 1
+        first_row = np.flatnonzero(starts)
 
-    def process(self, order_type, expense):
+        debit_total = group_sum(entry, to_paise(output_df[debit]), entries)
+        credit_total = group_sum(entry, to_paise(output_df[credit]), entries)
+        account = output_df["Account (Accounting Entries)"]
+        blank = (account.isna() | (account.astype(object).fillna("").astype(str).str.strip() == "")).to_numpy()
+        without_account = np.bincount(entry, weights=blank, minlength=entries).astype(np.int64)
 
-        output_rows, error_rows = [], []
+        issue_masks = {
+            "unbalanced": debit_total != credit_total,
+            "empty account": without_account > 0,
+            "no entry type": ~headed[first_row],
+        }
+        flagged = np.flatnonzero(np.logical_or.reduce(list(issue_masks.values())))
+        rows = first_row[flagged]
+
+        def column(name):
+            return output_df[name].to_numpy(dtype=object)[rows] if name in output_df else None
+
+        issues = pd.DataFrame({
+            "Entry": flagged + 1,
+            "First Row": rows,
+            "Entry Type": column("Entry Type"),
+            "Reference Number": column("Reference Number"),
+            "Posting Date": column("Posting Date"),
+            "Lines": np.diff(np.r_[first_row, len(output_df)])[flagged],
+            "Debit": to_rupees(debit_total[flagged]),
+            "Credit": to_rupees(credit_total[flagged]),
+            "Difference": to_rupees(debit_total[flagged] - credit_total[flagged]),
+            "Lines Without Account": without_account[flagged],
+            "Issue": [
+                ", ".join(issue for issue, mask in issue_masks.items() if mask[position]) for position in flagged
+            ],
+        }, columns=columns)
+        if batch.SOURCE_COLUMN in output_df:
+            issues.insert(2, batch.SOURCE_COLUMN, column(batch.SOURCE_COLUMN))
+        return issues
+
+    @staticmethod
+    def order_mask(df, query):
+        # Whole journal entries whose Reference Number matches; an entry runs
+        # from one Entry Type row to the next.
+        if "Entry Type" not in df or "Reference Number" not in df:
+            return contains_text(df, query)
+        entry = df["Entry Type"].notna().cumsum()
+        return entry.isin(entry[contains_text(df, query, ["Reference Number"])]).to_numpy()
+
+    @classmethod
+    def summarize(cls, output_df, error_df):
+        debit, credit = "Debit (Accounting Entries)", "Credit (Accounting Entries)"
+        if debit in output_df:
+            by_account = (
+                output_df.groupby("Account (Accounting Entries)", dropna=False)[[debit, credit]]
+                .sum()
+                .round(2)
+                .reset_index()
+            )
+            total_debit, total_credit = float(output_df[debit].sum()), float(output_df[credit].sum())
+        else:
+            by_account = pd.DataFrame()
+            total_debit = total_credit = 0.0
+        unbalanced = (
+            error_df[credit].dropna().str.replace("Total debit and Total credit do not match for ", "", regex=False)
+            if credit in error_df else pd.Series(dtype=object)
+        )
+        errors = cls.error_categories(error_df)
+        return {
+            "metrics": {
+                "Output rows": len(output_df),
+                "Journal entries": int(output_df["Entry Type"].notna().sum()) if "Entry Type" in output_df else 0,
+                "Total debit": round(total_debit, 2),
+                "Total credit": round(total_credit, 2),
+                "Error rows": len(error_df),
+            },
+            "tables": {
+                "Totals by account": by_account,
+                "Errors by type": pd.DataFrame([(name, rows) for name, rows in errors.items() if rows], columns=["Error", "Rows"]),
+                "Out of balance orders": pd.DataFrame({"Order": unbalanced.to_numpy()}),
+            },
+        }
+
+    def _prepare_statement(self):
+        # The first line only carries the settlement period; the rest is
+        # worked through in order-id order by every engine.
+        settlement_start_date = parse_date(self.payment_statement.iloc[0]["settlement-start-date"])
+        settlement_end_date = parse_date(self.payment_statement.iloc[0]["settlement-end-date"])
+
+        payment_statement = self.payment_statement.iloc[1:].reset_index(drop=True)
+        payment_statement.sort_values(by=["order-id"], inplace=True)
+
+        # Posted dates are parsed once, per distinct value; lines whose date
+        # does not parse are reported instead of processed.
+        with stage("date normalization"):
+            posted_date, invalid = normalize_dates(payment_statement["posted-date"], "%d.%m.%Y")
+        payment_statement["_posted_date"] = posted_date
+        invalid_lines = payment_statement[invalid]
+        date_errors = [
+            {"Posting Date": f"Error: Invalid posted date {value} for {order_id if pd.notna(order_id) else description}"}
+            for value, order_id, description in zip(
+                invalid_lines["posted-date"], invalid_lines["order-id"], invalid_lines["amount-description"]
+            )
+        ]
+        return payment_statement[~invalid], settlement_start_date, settlement_end_date, date_errors
+
+    def _process_legacy(self, order_type, expense):
+
+        output_rows = []
         processed_orders = set()
         expense = expense.split(',')
         total_expense_amount = 0
@@ -74,19 +580,19 @@ class PaymentStatementTemplate:
         total_debit = 0
         total_credit = 0
         first_principle = True
+        open_order, order_start = None, 0
 
-        settlement_start_date = parse_date(self.payment_statement.iloc[0]["settlement-start-date"])
-        settlement_end_date = parse_date(self.payment_statement.iloc[0]["settlement-end-date"])
-        
-        self.payment_statement = self.payment_statement.iloc[1:].reset_index(drop=True)
-        self.payment_statement.sort_values(by=["order-id"], inplace=True)
-        order_sums = self.payment_statement.groupby("order-id", as_index=False)["amount"].sum()
-        last_occurrence = self.payment_statement.reset_index().groupby("order-id")["index"].last().to_dict()
+        payment_statement, settlement_start_date, settlement_end_date, error_rows = self._prepare_statement()
+        order_sums = payment_statement.groupby("order-id", as_index=False)["amount"].sum()
+        last_occurrence = payment_statement.reset_index().groupby("order-id")["index"].last().to_dict()
+        end_journal_build = start_stage("journal build")
 
         
-        for index, order in self.payment_statement.iterrows():
+        for position, (index, order) in enumerate(payment_statement.iterrows()):
+            if position % PROGRESS_ROWS == 0:
+                progress(min(PROGRESS_ROWS, len(payment_statement) - position))
             order_id = order.get("order-id")
-            posting_date = datetime.strptime(str(order["posted-date"]), "%d.%m.%Y").strftime("%Y-%m-%d")
+            posting_date = order["_posted_date"]
 
             #For orders that do not have an order id.
             if pd.isna(order_id):
@@ -95,14 +601,8 @@ class PaymentStatementTemplate:
 
                 if order["amount-description"] == "Current Reserve Amount" or order["amount-description"] == "Previous Reserve Amount Balance":
 
-                    account_entry_debit = account_entry_credit = ""
-                    if order_type == "Electronic_" :
-                        account_entry_debit = "1601 - Amazon Electronic Fund - TMPL"
-                        account_entry_credit = "1602 - Amazon Freeze Fund - Electronic - TMPL"
-
-                    elif order_type == "COD_" :
-                        account_entry_debit = "1604 - Amazon COD Fund - TMPL"
-                        account_entry_credit = "1603 - Amazon Freeze Fund - COD - TMPL"               
+                    account_entry_debit = account_for("27", order_type, "reserve fund")
+                    account_entry_credit = account_for("27", order_type, "freeze fund")
 
                     output_rows.append({
                         "Company" : "Thakker Mercantile Private Limited",
@@ -126,18 +626,26 @@ class PaymentStatementTemplate:
                 continue
             
             # For order that have id
-            order_id_match = self.sale_register[self.sale_register["Customer's Purchase Order"] == order_id]
-            amount_description_match = self.matching_template[self.matching_template["amount-description"] == order["amount-description"]]
+            order_id_match = self.sale_register_lookup.get(order_id)
+            accounts = self.account_map.get(order["amount-description"])
             
-            if order_id_match.empty:
+            if order_id_match is None:
                 error_rows.append({"Reference Number": f"Error: No customer's Purchase Order for {order_id}"})
                 continue
-            if amount_description_match.empty:
-                error_rows.append({"Account (Accounting Entries)": f"Error: No match for {order["amount-description"]}"})
+            if accounts is None:
+                error_rows.append({"Account (Accounting Entries)": f"Error: No match for {order['amount-description']}"})
+                # An unmatched last line still closes an order that has others.
+                if open_order != order_id or index != last_occurrence[order_id]:
+                    continue
+            elif pd.isna(order_id_match["Reference Date"]):
+                error_rows.append({"Reference Date": f"Error: Invalid Posting Date in Sale Register for {order_id}"})
                 continue
+            elif open_order != order_id:
+                open_order, order_start = order_id, len(output_rows)
             
-            company_gstin = str(order_id_match.iloc[0]["Company GSTIN"])
-            account_entry = get_accounting_entry(company_gstin, amount_description_match)
+            company_gstin = str(order_id_match["Company GSTIN"])
+            state = gstin_state_code(company_gstin)
+            account_entry = get_accounting_entry(company_gstin, accounts) if accounts is not None else ""
 
 
             debit_entry = order["amount"] if order["amount"] < 0 else 0
@@ -147,22 +655,22 @@ class PaymentStatementTemplate:
             if account_entry in Constants.CREDITORS:
                 party, party_type = "Amazon Seller Services Private Limited", "Supplier"
             elif account_entry in Constants.DEBTORS:
-                party, party_type = order_id_match.iloc[0]["Customer Name"], "Customer"
-                reference_name = order_id_match.iloc[0]["Voucher"]
-                reference_type = order_id_match.iloc[0]["Voucher Type"]
+                party, party_type = order_id_match["Customer Name"], "Customer"
+                reference_name = order_id_match["Voucher"]
+                reference_type = order_id_match["Voucher Type"]
             
-            reference_date = datetime.strptime(str(order_id_match.iloc[0]["Posting Date"]), "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d")
+            reference_date = order_id_match["Reference Date"]
             user_remark = f"{order_id} {settlement_start_date} - {settlement_end_date}"
 
-            if(order["amount-description"] in expense):
+            if accounts is not None and order["amount-description"] in expense:
                 total_expense_amount += order["amount"]
 
-            if order["amount-description"] not in expense:
+            if accounts is not None and order["amount-description"] not in expense:
 
                 if(order["amount-description"] in "Principal") and first_principle:
                     principle_record = {
                         "Account (Accounting Entries)": account_entry,
-                        "Cost Center (Accounting Entries)": order_id_match.iloc[0]["Cost Center"],
+                        "Cost Center (Accounting Entries)": order_id_match["Cost Center"],
                         "Debit (Accounting Entries)": debit_entry * -1,
                         "Credit (Accounting Entries)": credit_entry,
                         "Party (Accounting Entries)": party,
@@ -177,7 +685,7 @@ class PaymentStatementTemplate:
                 
                     output_rows.append({
                         "Account (Accounting Entries)": account_entry,
-                        "Cost Center (Accounting Entries)": order_id_match.iloc[0]["Cost Center"],
+                        "Cost Center (Accounting Entries)": order_id_match["Cost Center"],
                         "Debit (Accounting Entries)": debit_entry * -1,
                         "Credit (Accounting Entries)": credit_entry,
                         "Party (Accounting Entries)": party,
@@ -191,7 +699,7 @@ class PaymentStatementTemplate:
                     total_debit += debit_entry * -1
                 else:
                     output_rows.append({
-                        "Company": order_id_match.iloc[0]["Company"],
+                        "Company": order_id_match["Company"],
                         "Entry Type": "Bank Entry",
                         "Posting Date": posting_date,
                         "Series": Constants.SERIES_FORMAT,
@@ -200,7 +708,7 @@ class PaymentStatementTemplate:
                         "User Remark": user_remark,
                         "Company GSTIN": company_gstin,
                         "Account (Accounting Entries)": account_entry,
-                        "Cost Center (Accounting Entries)": order_id_match.iloc[0]["Cost Center"],
+                        "Cost Center (Accounting Entries)": order_id_match["Cost Center"],
                         "Debit (Accounting Entries)": debit_entry * -1,
                         "Credit (Accounting Entries)": credit_entry,
                         "Party (Accounting Entries)": party,
@@ -219,6 +727,16 @@ class PaymentStatementTemplate:
             if order_id in last_occurrence and index == last_occurrence[order_id]:
 
                 first_principle = True
+
+                # Without a Principal line there is no account to fold the
+                # expenses into, so the whole order is reported instead.
+                if "Account (Accounting Entries)" not in principle_record:
+                    del output_rows[order_start:]
+                    error_rows.append({"Reference Number": f"{self.NO_PRINCIPAL_ERROR}{order_id}"})
+                    total_expense_amount = 0
+                    total_credit = 0
+                    total_debit = 0
+                    continue
                 
                 if "Credit (Accounting Entries)" not in principle_record:
                     principle_record["Credit (Accounting Entries)"] = 0
@@ -229,20 +747,9 @@ class PaymentStatementTemplate:
                 
                 total_credit += principle_record["Credit (Accounting Entries)"]
 
-                account_accounting_entries_for_end_total = ''
+                account_accounting_entries_for_end_total = account_for(state, order_type, "fund")
 
                 total_amount = order_sums.loc[order_sums['order-id'] == order_id, 'amount'].values[0]
-                if order_type == 'COD_':
-                    if re.match(r"^27\d*", company_gstin):
-                        account_accounting_entries_for_end_total = '1604 - Amazon COD Fund - TMPL'
-                    if re.match(r"^29\d*", company_gstin):
-                        account_accounting_entries_for_end_total = '1604 - Amazon COD Fund - TMPL29'
-
-                if order_type == 'Electronic_':
-                    if re.match(r"^27\d*", company_gstin):
-                        account_accounting_entries_for_end_total = '1601 - Amazon Electronic Fund - TMPL'
-                    if re.match(r"^29\d*", company_gstin):
-                        account_accounting_entries_for_end_total = '1601 - Amazon Electronic Fund - TMPL29'
 
                 credit_entry_for_end_total = min(total_amount, 0) * -1
                 debit_entry_for_end_total =  max(total_amount, 0)
@@ -259,26 +766,19 @@ class PaymentStatementTemplate:
                 difference = round(total_credit) - total_credit
                 difference = round(difference, 2)
 
-                print("Total Credit : ", total_credit)
-                print("Total Debit : ", total_debit)
-
-                print("Round off : ", difference)
+                if tracing():
+                    trace([{"Order": order_id, "Total Credit": total_credit, "Total Debit": total_debit, "Round off": difference}])
 
                 if(difference != 0) :
 
                     credit_entry = min(difference, 0) * -1
                     debit_entry =  max(difference, 0)
                     
-                    account_accounting_entries = ''
-
-                    if re.match(r"^27\d*", company_gstin):
-                        account_accounting_entries = 'Rounded Off - TMPL'
-                    if re.match(r"^29\d*", company_gstin):
-                        account_accounting_entries = 'Rounded Off - TMPL29'
+                    account_accounting_entries = account_for(state, order_type, "round off")
 
                     output_rows.append({
                         "Account (Accounting Entries)": account_accounting_entries,
-                        "Cost Center (Accounting Entries)": order_id_match.iloc[0]["Cost Center"],
+                        "Cost Center (Accounting Entries)": order_id_match["Cost Center"],
                         "Debit (Accounting Entries)":debit_entry,
                         "Credit (Accounting Entries)": credit_entry,
                     })
@@ -296,10 +796,11 @@ class PaymentStatementTemplate:
                     principle_record["User Remark (Accounting Entries)"] = "ItemPrice|Principle " + "("+ str(principle_record["Credit (Accounting Entries)"]) + ")" + "- [Expense: "+ str(total_expense_amount) +"]" + "- [Roundoff: "+ str(difference) + "]" 
 
                 output_rows.append(principle_record)
+                principle_record = {}
 
                 output_rows.append({
                     "Account (Accounting Entries)": account_accounting_entries_for_end_total,
-                    "Cost Center (Accounting Entries)": order_id_match.iloc[0]["Cost Center"],
+                    "Cost Center (Accounting Entries)": order_id_match["Cost Center"],
                     "Debit (Accounting Entries)":debit_entry_for_end_total,
                     "Credit (Accounting Entries)": credit_entry_for_end_total,
                 })
@@ -308,16 +809,19 @@ class PaymentStatementTemplate:
                 total_credit = 0
                 total_debit = 0
 
+        end_journal_build()
+        end_null_order_grouping = start_stage("null-order grouping")
+
         # For the order that don't have order id and are of type Advertisement and business sdvisory !
-        null_orders = self.payment_statement[pd.isna(self.payment_statement["order-id"]) & 
-                                            self.payment_statement["amount-type"].isin(["Cost of Advertising", "Amazon Business Advisory Fee"])]
+        null_orders = payment_statement[pd.isna(payment_statement["order-id"]) & 
+                                        payment_statement["amount-type"].isin(self.NULL_ORDER_AMOUNT_TYPES)]
         null_orders.sort_values(by=["posted-date"], inplace=True)
 
         posted_dates = set()
 
         grouped_null_orders = null_orders.groupby("posted-date", sort=False)
-        for posted_date, group in grouped_null_orders:
-            posted_date = datetime.strptime(posted_date, "%d.%m.%Y").strftime("%Y-%m-%d")
+        for _, group in grouped_null_orders:
+            posted_date = group["_posted_date"].iloc[0]
             total_amount = group["amount"].sum()
             
             for _, order in group.iterrows():
@@ -339,7 +843,7 @@ class PaymentStatementTemplate:
                         "Posting Date": posted_date,
                         "Series": Constants.SERIES_FORMAT,
                         "Reference Date": posted_date,
-                        "Reference Number": f"{settlement_start_date} - {settlement_end_date} - {order["amount-type"]}",
+                        "Reference Number": f"{settlement_start_date} - {settlement_end_date} - {order['amount-type']}",
                         "User Remark": f"{settlement_start_date} - {settlement_end_date}",
                         "Company GSTIN": "27AACCT1557E1ZH",
                         "Account (Accounting Entries)": "Creditors (INR) - TMPL",
@@ -352,12 +856,7 @@ class PaymentStatementTemplate:
                     posted_dates.add(posted_date)
             
             
-                accounting_entry = ""
-                if order_type == "Electronic_" :
-                    accounting_entry = "1601 - Amazon Electronic Fund - TMPL"
-
-                elif order_type == "COD_" :
-                    accounting_entry = "1603 - Amazon Freeze Fund - COD - TMPL"  
+                accounting_entry = account_for("27", order_type, "null order fund")
 
             output_rows.append({
                 "Account (Accounting Entries)": accounting_entry,
@@ -365,5 +864,328 @@ class PaymentStatementTemplate:
                 "Debit (Accounting Entries)": 0,
                 "Credit (Accounting Entries)": total_amount * -1,
             })
-        
-        return pd.DataFrame(output_rows), pd.DataFrame(error_rows)
+
+        end_null_order_grouping()
+        return self.JOURNAL_SCHEMA.from_records(output_rows), self.ERROR_SCHEMA.from_records(error_rows)
+
+    def _process_groupby(self, order_type, expense, partitions=1):
+        payment_statement, settlement_start_date, settlement_end_date, date_errors = self._prepare_statement()
+        partitions = min(partitions, -(-len(payment_statement) // self.PARTITION_ROWS))
+        with stage("journal build"):
+            if partitions > 1:
+                output_blocks, error_blocks = self._partitioned_blocks(
+                    payment_statement, order_type, expense.split(','), settlement_start_date, settlement_end_date, partitions
+                )
+            else:
+                output_blocks, error_blocks = self._journal_blocks(
+                    payment_statement, order_type, expense.split(','), settlement_start_date, settlement_end_date
+                )
+                progress(len(payment_statement))
+        error_blocks.insert(0, journal_block(np.full(len(date_errors), -1), 0, pd.DataFrame(date_errors)))
+        with stage("null-order grouping"):
+            output_blocks += self._null_order_blocks(
+                payment_statement, order_type, settlement_start_date, settlement_end_date, len(payment_statement)
+            )
+        with stage("assemble"):
+            return assemble_blocks(output_blocks, self.JOURNAL_SCHEMA), assemble_blocks(error_blocks, self.ERROR_SCHEMA)
+
+    def _partitioned_blocks(self, payment_statement, order_type, expense, settlement_start_date, settlement_end_date,
+                            partitions):
+        # Lines are hash partitioned on order id, so every order (and all the
+        # lines without one) lands whole in one partition; each worker gets
+        # its lines with their statement positions and only the sale register
+        # rows of its orders. The (_pos, _seq) tags put the blocks back in
+        # serial order when they are assembled.
+        lines = payment_statement.reset_index(drop=True)
+        partition = pd.util.hash_array(lines["order-id"].to_numpy(dtype=object)) % partitions
+        register_position = self.sale_register_index.index.get_indexer(lines["order-id"])
+        futures = {}
+        for number in range(partitions):
+            selected = np.flatnonzero(partition == number)
+            if not len(selected):
+                continue
+            part = lines.iloc[selected]
+            template = PaymentStatementTemplate.__new__(PaymentStatementTemplate)
+            needed = np.unique(register_position[selected])
+            template.sale_register_index = self.sale_register_index.iloc[needed[needed >= 0]]
+            template.account_index = self.account_index
+            future = batch.partition_pool().submit(
+                partition_blocks, template, part, selected, order_type, expense,
+                settlement_start_date, settlement_end_date, tracing()
+            )
+            futures[future] = len(selected)
+        for future in as_completed(futures):
+            progress(futures[future])
+        output_blocks, error_blocks = [], []
+        for future in futures:
+            (partition_output, partition_errors), traces = future.result()
+            output_blocks += partition_output
+            error_blocks += partition_errors
+            trace(traces)
+        return output_blocks, error_blocks
+
+    def _journal_blocks(self, payment_statement, order_type, expense, settlement_start_date, settlement_end_date,
+                        position=None):
+        # Every row is tagged with the statement position it belongs to (_pos)
+        # and its place among the rows emitted there (_seq), so the blocks can
+        # be built independently and interleaved afterwards. A partition
+        # passes the statement positions of its lines.
+        lines = payment_statement.reset_index(drop=True)
+        position = np.arange(len(lines)) if position is None else np.asarray(position)
+        # Money is held as int64 paise from here on, so every sum, balance and
+        # round off is exact; it goes back to rupees as the blocks are built.
+        amount = to_paise(lines["amount"])
+        order_id = lines["order-id"].to_numpy(dtype=object)
+        description = lines["amount-description"].to_numpy(dtype=object)
+        posting_date = lines["_posted_date"].to_numpy(dtype=object)
+        has_id = lines["order-id"].notna().to_numpy()
+        debit = np.where(amount < 0, -amount, 0)
+        credit = np.where(amount >= 0, amount, 0)
+
+        output_blocks, error_blocks = [], []
+
+        # Reserve lines without an order id become a two line contra entry.
+        reserve = ~has_id & lines["amount-description"].isin(self.RESERVE_DESCRIPTIONS).to_numpy()
+        fund_account = account_for("27", order_type, "reserve fund")
+        freeze_account = account_for("27", order_type, "freeze fund")
+        output_blocks.append(journal_block(position[reserve], 0, {
+            "Company": "Thakker Mercantile Private Limited",
+            "Entry Type": "Contra Entry",
+            "Posting Date": posting_date[reserve],
+            "Series": Constants.SERIES_FORMAT,
+            "Reference Date": posting_date[reserve],
+            "Cost Center (Accounting Entries)": "6 - Retail - TMPL",
+            "Account (Accounting Entries)": fund_account,
+            "Debit (Accounting Entries)": to_rupees(credit[reserve]),
+            "Credit (Accounting Entries)": to_rupees(debit[reserve]),
+        }))
+        output_blocks.append(journal_block(position[reserve], 1, {
+            "Account (Accounting Entries)": freeze_account,
+            "Debit (Accounting Entries)": to_rupees(debit[reserve]),
+            "Credit (Accounting Entries)": to_rupees(credit[reserve]),
+        }))
+
+        register_position = self.sale_register_index.index.get_indexer(order_id)
+        account_position = self.account_index.index.get_indexer(description)
+        register_dated = self.sale_register_index["Reference Date"].notna().to_numpy()[register_position] & (register_position >= 0)
+        missing_register = has_id & (register_position < 0)
+        missing_account = has_id & (register_position >= 0) & (account_position < 0)
+        invalid_register_date = has_id & (register_position >= 0) & (account_position >= 0) & ~register_dated
+        matched = has_id & register_dated & (account_position >= 0)
+
+        error_blocks.append(journal_block(position[missing_register], 0, {
+            "Reference Number": [f"Error: No customer's Purchase Order for {value}" for value in order_id[missing_register]],
+        }))
+        error_blocks.append(journal_block(position[missing_account], 0, {
+            "Account (Accounting Entries)": [f"Error: No match for {value}" for value in description[missing_account]],
+        }))
+        error_blocks.append(journal_block(position[invalid_register_date], 0, {
+            "Reference Date": [f"Error: Invalid Posting Date in Sale Register for {value}" for value in order_id[invalid_register_date]],
+        }))
+
+        rows = np.flatnonzero(matched)
+        line_order = order_id[rows]
+        line_amount = amount[rows]
+        line_debit = debit[rows]
+        line_credit = credit[rows]
+        line_description = description[rows]
+        register = self.sale_register_index.iloc[register_position[rows]]
+        accounts = self.account_index.iloc[account_position[rows]]
+
+        gstin = map_unique(register["Company GSTIN"], str)
+        # Category code of the state per line, -1 when the GSTIN's state is
+        # not one of ours; index -1 lands on the blank column / row appended
+        # to the account matrix and table.
+        state = register["State Code"].cat.codes.to_numpy()
+        erp_accounts = np.column_stack([accounts.to_numpy(dtype=object), np.full(len(accounts), "", dtype=object)])
+        account = erp_accounts[np.arange(len(accounts)), state]
+        table = account_table(order_type)
+        creditor = pd.Series(account).isin(Constants.CREDITORS).to_numpy()
+        debtor = pd.Series(account).isin(Constants.DEBTORS).to_numpy() & ~creditor
+        party = np.where(creditor, "Amazon Seller Services Private Limited",
+                         np.where(debtor, register["Customer Name"].to_numpy(dtype=object), ""))
+        party_type = np.where(creditor, "Supplier", np.where(debtor, "Customer", ""))
+        reference_name = np.where(debtor, register["Voucher"].to_numpy(dtype=object), "")
+        reference_type = np.where(debtor, register["Voucher Type"].to_numpy(dtype=object), "")
+        cost_center = register["Cost Center"].to_numpy(dtype=object)
+        reference_date = register["Reference Date"].to_numpy(dtype=object)
+        user_remark = (lines["amount-type"] + "|" + lines["amount-description"]).to_numpy(dtype=object)[rows]
+
+        # Per order: expenses fold into the first Principal line, which is held
+        # back until the order closes; every other line is written as it comes
+        # and the first of them carries the Bank Entry header.
+        codes, order_ids = pd.factorize(line_order)
+        order_count = len(order_ids)
+        is_expense = pd.Series(line_description).isin(expense).to_numpy()
+        candidate = ~is_expense & map_unique(line_description, lambda value: value in "Principal").astype(bool)
+        is_principal = candidate & (group_cumsum(candidate, codes) == 1)
+        emitted = ~is_expense & ~is_principal
+        # Without a Principal line there is no account to fold the expenses
+        # into, so the whole order is reported instead of journalled.
+        principal_index = np.full(order_count, -1)
+        principal_index[codes[is_principal]] = np.flatnonzero(is_principal)
+        has_principal = principal_index >= 0
+        is_header = emitted & (group_cumsum(emitted, codes) == 1) & has_principal[codes]
+        is_line = emitted & ~is_header & has_principal[codes]
+
+        def accounting_fields(index):
+            return {
+                "Account (Accounting Entries)": account[index],
+                "Cost Center (Accounting Entries)": cost_center[index],
+                "Debit (Accounting Entries)": to_rupees(line_debit[index]),
+                "Credit (Accounting Entries)": to_rupees(line_credit[index]),
+                "Party (Accounting Entries)": party[index],
+                "Party Type (Accounting Entries)": party_type[index],
+                "Reference Name (Accounting Entries)": reference_name[index],
+                "Reference Type (Accounting Entries)": reference_type[index],
+            }
+
+        output_blocks.append(journal_block(position[rows][is_header], 0, {
+            "Company": register["Company"].to_numpy(dtype=object)[is_header],
+            "Entry Type": "Bank Entry",
+            "Posting Date": posting_date[rows][is_header],
+            "Series": Constants.SERIES_FORMAT,
+            "Reference Date": reference_date[is_header],
+            "Reference Number": line_order[is_header],
+            "User Remark": [f"{value} {settlement_start_date} - {settlement_end_date}" for value in line_order[is_header]],
+            "Company GSTIN": gstin[is_header],
+            **accounting_fields(is_header),
+            "User Remark (Accounting Entries)": user_remark[is_header],
+        }))
+        output_blocks.append(journal_block(position[rows][is_line], 0, {
+            **accounting_fields(is_line),
+            "User Remark (Accounting Entries)": user_remark[is_line],
+        }))
+
+        def order_sum(mask, values):
+            return group_sum(codes, np.where(mask, values, 0), order_count)
+
+        expense_total = order_sum(is_expense, line_amount)
+        has_expense = np.bincount(codes, weights=is_expense, minlength=order_count) > 0
+        credit_total = order_sum(emitted, line_credit)
+        debit_total = order_sum(emitted, line_debit)
+
+        principal_credit = np.where(has_principal, line_credit[principal_index], 0)
+        first_line = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if order_count else np.array([], dtype=int)
+        order_state = state[first_line]
+        order_cost_center = cost_center[first_line]
+
+        # The fund line balances the whole order, unmatched lines included.
+        order_codes = pd.Index(order_ids).get_indexer(order_id[has_id])
+        known = order_codes >= 0
+        total_amount = group_sum(order_codes[known], amount[has_id][known], order_count)
+        close_position = (
+            pd.Series(position[has_id]).groupby(order_id[has_id]).max().reindex(order_ids).to_numpy(dtype=np.int64)
+        )
+
+        end_credit = np.where(total_amount < 0, -total_amount, 0)
+        end_debit = np.where(total_amount > 0, total_amount, 0)
+        principal_total = principal_credit + expense_total
+        total_credit = credit_total + principal_total + end_credit
+        total_debit = debit_total + end_debit
+        round_off = round_to_rupee(total_credit) - total_credit
+        if tracing():
+            trace(pd.DataFrame({
+                "Order": order_ids,
+                "Total Credit": to_rupees(total_credit),
+                "Total Debit": to_rupees(total_debit),
+                "Round off": to_rupees(round_off),
+            })[has_principal].to_dict("records"))
+
+        missing_principal = ~has_principal
+        error_blocks.append(journal_block(close_position[missing_principal], 1, {
+            "Reference Number": [f"{self.NO_PRINCIPAL_ERROR}{value}" for value in order_ids[missing_principal]],
+        }))
+
+        unbalanced = (total_debit != total_credit) & has_principal
+        error_blocks.append(journal_block(close_position[unbalanced], 1, {
+            "Credit (Accounting Entries)": [f"Total debit and Total credit do not match for {value}" for value in order_ids[unbalanced]],
+        }))
+
+        has_round_off = (round_off != 0) & has_principal
+        output_blocks.append(journal_block(close_position[has_round_off], 1, {
+            "Account (Accounting Entries)": table["round off"].to_numpy(dtype=object)[order_state[has_round_off]],
+            "Cost Center (Accounting Entries)": order_cost_center[has_round_off],
+            "Debit (Accounting Entries)": to_rupees(np.where(round_off > 0, round_off, 0)[has_round_off]),
+            "Credit (Accounting Entries)": to_rupees(np.where(round_off < 0, -round_off, 0)[has_round_off]),
+        }))
+
+        # A negative round off is taken off the fund line and added twice to
+        # the principal so both sides move to the rounded total.
+        round_off_term = np.where(round_off < 0, round_off * 2, round_off)
+        end_debit = np.where(round_off < 0, end_debit + round_off, end_debit)
+        principal_total = np.where(has_round_off, principal_total + round_off_term, principal_total)
+        expense_text = [str(value) if flag else "0" for value, flag in zip(to_rupees(expense_total).tolist(), has_expense)]
+        principal_remark = np.array([
+            "ItemPrice|Principle " + "(" + str(total) + ")" + "- [Expense: " + expense + "]" + "- [Roundoff: " + str(term) + "]"
+            for total, expense, term in zip(to_rupees(principal_total).tolist(), expense_text, to_rupees(round_off_term).tolist())
+        ], dtype=object)
+        principal_total = to_rupees(principal_total)
+
+        for with_remark in (True, False):
+            selected = has_principal & (has_round_off == with_remark)
+            fields = accounting_fields(principal_index[selected])
+            fields["Credit (Accounting Entries)"] = principal_total[selected]
+            if with_remark:
+                fields["User Remark (Accounting Entries)"] = principal_remark[selected]
+            output_blocks.append(journal_block(close_position[selected], 2, fields))
+
+        output_blocks.append(journal_block(close_position[has_principal], 3, {
+            "Account (Accounting Entries)": table["fund"].to_numpy(dtype=object)[order_state[has_principal]],
+            "Cost Center (Accounting Entries)": order_cost_center[has_principal],
+            "Debit (Accounting Entries)": to_rupees(end_debit[has_principal]),
+            "Credit (Accounting Entries)": to_rupees(end_credit[has_principal]),
+        }))
+
+        return output_blocks, error_blocks
+
+    def _null_order_blocks(self, payment_statement, order_type, settlement_start_date, settlement_end_date, offset):
+        # Advertising and advisory fees have no order id; they are grouped into
+        # one contra entry per posted date, after all the order blocks.
+        null_orders = payment_statement[pd.isna(payment_statement["order-id"]) &
+                                        payment_statement["amount-type"].isin(self.NULL_ORDER_AMOUNT_TYPES)]
+        null_orders = null_orders.sort_values(by=["posted-date"])
+
+        position = offset + np.arange(len(null_orders))
+        amount = to_paise(null_orders["amount"])
+        debit = np.where(amount < 0, -amount, 0)
+        credit = np.where(amount > 0, amount, 0)
+        posted_date = null_orders["_posted_date"].to_numpy(dtype=object)
+        is_header = ~pd.Series(posted_date).duplicated().to_numpy()
+        group_codes, _ = pd.factorize(null_orders["posted-date"])
+        group_last = np.flatnonzero(np.r_[group_codes[1:] != group_codes[:-1], True]) if len(null_orders) else np.array([], dtype=int)
+        group_totals = group_sum(group_codes, amount, len(group_last))
+
+        def creditor_fields(mask):
+            return {
+                "Account (Accounting Entries)": "Creditors (INR) - TMPL",
+                "Cost Center (Accounting Entries)": "6 - Retail - TMPL",
+                "Debit (Accounting Entries)": to_rupees(debit[mask]),
+                "Credit (Accounting Entries)": to_rupees(credit[mask]),
+                "Party (Accounting Entries)": "Amazon Seller Services Private Limited",
+                "Party Type (Accounting Entries)": "Supplier",
+            }
+
+        return [
+            journal_block(position[is_header], 0, {
+                "Company": "Thakker Mercantile Private Limited",
+                "Entry Type": "Contra Entry",
+                "Posting Date": posted_date[is_header],
+                "Series": Constants.SERIES_FORMAT,
+                "Reference Date": posted_date[is_header],
+                "Reference Number": [
+                    f"{settlement_start_date} - {settlement_end_date} - {value}"
+                    for value in null_orders["amount-type"].to_numpy(dtype=object)[is_header]
+                ],
+                "User Remark": f"{settlement_start_date} - {settlement_end_date}",
+                "Company GSTIN": "27AACCT1557E1ZH",
+                **creditor_fields(is_header),
+            }),
+            journal_block(position[~is_header], 0, creditor_fields(~is_header)),
+            journal_block(position[group_last], 1, {
+                "Account (Accounting Entries)": account_for("27", order_type, "null order fund"),
+                "Cost Center (Accounting Entries)": "6 - Retail - TMPL",
+                "Debit (Accounting Entries)": 0,
+                "Credit (Accounting Entries)": to_rupees(-group_totals),
+            }),
+        ]
@@ -1,31 +1,293 @@
+import copy
+import numpy as np
 import pandas as pd
-from datetime import datetime
-from helpers.utils import extract_pack_of_quantity, calculate_price_per_packet, format_state
+from helpers.utils import extract_pack_of_quantity, pack_of_quantities, whole_numbers, calculate_price_per_packet, format_state, normalize_dates, map_unique, lookup_first, contains_text
 from helpers.file_handler import FileHandler
+from helpers.cache import content_hash
+from helpers.ledger import line_keys
+from helpers.batch import source_name
+from helpers.instrumentation import PROGRESS_ROWS, count, count_errors, progress, stage, trace, tracing
+from helpers.schema import Column, OutputSchema
 
 class SaleOrderTemplate:
 
     REQUIRED_AMAZON_COLUMNS = ['asin', 'item-price', 'quantity', 'ship-state', 'purchase-date', 'amazon-order-id']
     REQUIRED_CP_COLUMNS = ['Amazon ASIN', 'Item Code']
     REQUIRED_BUNDLE_COLUMNS = ['ID', 'Item (Product Bundle Item)', 'Qty (Product Bundle Item)']
+
+    OPTIONAL_AMAZON_COLUMNS = ['fulfillment-channel']
+
+    AMAZON_DTYPES = {
+        'asin': str,
+        'item-price': float,
+        'ship-state': str,
+        'purchase-date': str,
+        'amazon-order-id': str,
+        'fulfillment-channel': str,
+    }
+    CP_DTYPES = {'Amazon ASIN': str, 'Item Code': str}
+    BUNDLE_DTYPES = {'ID': str, 'Item (Product Bundle Item)': str}
+
+    ENGINES = ('vectorized', 'legacy')
+    MONEY_COLUMNS = ('Rate (Items)', 'Rate of Stock UOM (Items)')
+
+    # Sale order import layout. Output and error rows share it; error rows
+    # feed the message into item_code and only rate errors fill rate.
+    OUTPUT_SCHEMA = OutputSchema([
+        Column('Item Code (Items)', 'item_code'),
+        Column('Quantity (Items)', 'quantity'),
+        Column('Rate (Items)', 'rate'),
+        Column('Customer', 'customer'),
+        Column('Date', 'date'),
+        Column('Customer\'s Purchase Order', 'order_id'),
+        Column('Customer\'s Purchase Order Date', 'date'),
+        Column('Rate of Stock UOM (Items)', 'stock_rate'),
+        Column('Fulfilled By', 'fulfilled_by'),
+        Column('Company', default=''),
+        Column('Cost Center', default='6 - Retail - TMPL'),
+        Column('Currency', default='INR'),
+        Column('Order Type', default='Shopping Cart'),
+        Column('Price List', default='Standard Selling'),
+        Column('Status', default='Draft'),
+        Column('Price List Exchange Rate', default='1'),
+        Column('Exchange Rate', default='1'),
+        Column('Cost Center (Items)', default='6 - Retail - TMPL'),
+        Column('Price List Currency', default='INR'),
+        Column('Series', default='SAL-ORD-.YYYY.-'),
+        Column('Company Address', default=''),
+        Column('Company Address Name', default=''),
+        Column('Payment Terms Template', default='7DINVOICE_LOCAL'),
+        Column('Sales Taxes and Charges Template', default=''),
+        Column('Set Source Warehouse', default=''),
+        Column('UOM (Items)', default='Nos'),
+        Column('Delivery Date (Items)', default=''),
+        Column('Delivery Warehouse (Items)', default=''),
+    ])
+
+    LEDGER_KIND = 'sale_order'
+    LEDGER_KEY_COLUMNS = ['amazon-order-id', 'asin']
+    # Ledger keys of the report as first given, and the rows of the report
+    # the last process() run emitted lines for.
+    input_keys = None
+    emitted_rows = None
+    STORED_REFERENCES = ('cp_items', 'product_bundles')
     
     def __init__(self, amazon_file, cp_file, product_bundle_file):
-        self.amazon_df = FileHandler.read_excel(amazon_file)
-        self.cp_df = FileHandler.read_excel(cp_file)
-        self.bundle_df = FileHandler.read_excel(product_bundle_file)
+        amazon_df, self.cp_df, self.bundle_df = FileHandler.read_many([
+            self.input_read(amazon_file), self.cp_items_read(cp_file), self.bundles_read(product_bundle_file)
+        ])
+        self.amazon_df = self.with_optional_columns(amazon_df)
+
+    @classmethod
+    def input_read(cls, amazon_file):
+        return {
+            'file': amazon_file,
+            'required_columns': cls.REQUIRED_AMAZON_COLUMNS,
+            'optional_columns': cls.OPTIONAL_AMAZON_COLUMNS,
+            'dtypes': cls.AMAZON_DTYPES,
+            'file_name': "Amazon Sale Order Template",
+        }
+
+    @classmethod
+    def cp_items_read(cls, cp_file):
+        return {
+            'file': cp_file, 'required_columns': cls.REQUIRED_CP_COLUMNS, 'dtypes': cls.CP_DTYPES, 'file_name': "CP Item List"
+        }
+
+    @classmethod
+    def bundles_read(cls, product_bundle_file):
+        return {
+            'file': product_bundle_file,
+            'required_columns': cls.REQUIRED_BUNDLE_COLUMNS,
+            'dtypes': cls.BUNDLE_DTYPES,
+            'file_name': "Product Bundle",
+        }
+
+    @classmethod
+    def reference_reads(cls, cp_file=None, product_bundle_file=None):
+        reads = [cls.cp_items_read(cp_file), cls.bundles_read(product_bundle_file)]
+        return [read for read in reads if read['file'] is not None]
+
+    @classmethod
+    def read_input(cls, amazon_file, use_cache=True):
+        return FileHandler.read_columns(**cls.input_read(amazon_file), use_cache=use_cache)
+
+    @classmethod
+    def from_frames(cls, amazon_df, cp_df, bundle_df):
+        template = cls.__new__(cls)
+        template.cp_df = cp_df
+        template.bundle_df = bundle_df
+        FileHandler.validate_columns(cp_df, cls.REQUIRED_CP_COLUMNS, "CP Item List")
+        FileHandler.validate_columns(bundle_df, cls.REQUIRED_BUNDLE_COLUMNS, "Product Bundle")
+        template.amazon_df = None
+        return template.with_input(amazon_df) if amazon_df is not None else template
+
+    @classmethod
+    def from_reference(cls, cp_file=None, product_bundle_file=None, store=None):
+        # A template holding only the reference data; give it orders with
+        # with_input() before processing. With a store, uploaded files are
+        # stored and used, and missing ones are loaded at the current version.
+        if store is not None:
+            cls.store_reference(store, cp_file, product_bundle_file)
+            return cls.from_store(store, store.resolve(cls.STORED_REFERENCES, [cp_file, product_bundle_file]))
+        template = cls.__new__(cls)
+        template.amazon_df = None
+        template.cp_df, template.bundle_df = FileHandler.read_many([
+            cls.cp_items_read(cp_file), cls.bundles_read(product_bundle_file)
+        ])
+        return template
+
+    @classmethod
+    def read_cp_items(cls, cp_file):
+        return FileHandler.read_columns(**cls.cp_items_read(cp_file))
+
+    @classmethod
+    def read_bundles(cls, product_bundle_file):
+        return FileHandler.read_columns(**cls.bundles_read(product_bundle_file))
+
+    @classmethod
+    def store_reference(cls, store, cp_file=None, product_bundle_file=None):
+        if cp_file is not None:
+            store.put('cp_items', cls.read_cp_items(cp_file), content_hash(cp_file), ['Amazon ASIN'], source_name(cp_file))
+        if product_bundle_file is not None:
+            store.put(
+                'product_bundles', cls.read_bundles(product_bundle_file), content_hash(product_bundle_file), ['ID'],
+                source_name(product_bundle_file)
+            )
+
+    @classmethod
+    def from_store(cls, store, versions=(None, None)):
+        cp_version, bundle_version = versions
+        return cls.from_frames(
+            None,
+            store.load('cp_items', cp_version, dtypes=cls.CP_DTYPES, label="CP Item List"),
+            store.load('product_bundles', bundle_version, dtypes=cls.BUNDLE_DTYPES, label="Product Bundle"),
+        )
+
+    def with_input(self, amazon_df):
+        FileHandler.validate_columns(amazon_df, self.REQUIRED_AMAZON_COLUMNS, "Amazon Sale Order Template")
+        template = copy.copy(self)
+        template.amazon_df = self.with_optional_columns(amazon_df)
+        template.input_keys = None
+        template.emitted_rows = None
+        return template
+
+    @classmethod
+    def with_optional_columns(cls, amazon_df):
+        # Optional columns a report does not have are left blank in the output.
+        missing = [column for column in cls.OPTIONAL_AMAZON_COLUMNS if column not in amazon_df]
+        return amazon_df.assign(**dict.fromkeys(missing, '')) if missing else amazon_df
+
+    def ledger_keys(self):
+        # One key per report row: order, ASIN and occurrence. new_only keeps
+        # the keys of the full report, so dropping rows does not renumber them.
+        if self.input_keys is not None:
+            return self.input_keys
+        return line_keys(self.amazon_df, self.LEDGER_KEY_COLUMNS)
+
+    def new_only(self, ledger):
+        # Drops the rows the ledger already has, so only the delta of an
+        # overlapping report is processed.
+        keys = self.ledger_keys()
+        known = ledger.known(self.LEDGER_KIND, keys)
+        count('rows skipped', int(known.sum()))
+        if not known.any():
+            return self
+        template = self.with_input(self.amazon_df[~known].reset_index(drop=True))
+        template.input_keys = keys[~known]
+        return template
+
+    def processed_keys(self):
+        # Rows count as processed once process() emitted sale order lines for
+        # them; rows that only produced errors are tried again next time,
+        # even when other rows of their order went through.
+        return self.ledger_keys()[self.emitted_rows]
+
+    def record_processed(self, ledger, run=''):
+        recorded = ledger.record(self.LEDGER_KIND, self.processed_keys(), run)
+        count('rows recorded', recorded)
+        return recorded
 
-        FileHandler.validate_columns(self.amazon_df, self.REQUIRED_AMAZON_COLUMNS, "Amazon Sale Order Template")
-        FileHandler.validate_columns(self.cp_df, self.REQUIRED_CP_COLUMNS, "CP Item List")
-        FileHandler.validate_columns(self.bundle_df, self.REQUIRED_BUNDLE_COLUMNS, "Product Bundle")
+    def process(self, engine='vectorized', pack_sizes=False):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine '{engine}', expected one of: {', '.join(self.ENGINES)}")
+        count('rows in', len(self.amazon_df))
+        with stage('date normalization'):
+            dates, invalid_dates = normalize_dates(self.amazon_df['purchase-date'], 'ISO8601')
+        with stage('process'):
+            if engine == 'vectorized':
+                output_df, error_df = self._process_vectorized(dates, invalid_dates, pack_sizes)
+            else:
+                output_df, error_df = self._process_legacy(dates, pack_sizes)
+        count('rows out', len(output_df))
+        count_errors(self.error_categories(error_df))
+        return [output_df, error_df]
+
+    @staticmethod
+    def error_categories(error_df):
+        if error_df.empty:
+            return {}
+        item = error_df['Item Code (Items)'].astype(object).fillna('')
+        rate = error_df['Rate (Items)'] if 'Rate (Items)' in error_df else pd.Series(np.nan, index=error_df.index)
+        return {
+            'invalid date': int(item.str.startswith('Error: Invalid purchase date').sum()),
+            'no CP item': int(item.str.startswith('Error: No CP Item').sum()),
+            'no product bundle': int(item.str.startswith('Error: No Product Bundle').sum()),
+            'rate': int(rate.notna().sum()),
+        }
+
+    @staticmethod
+    def order_mask(df, query):
+        return contains_text(df, query, ['Customer\'s Purchase Order'])
 
-    def process(self):
+    @classmethod
+    def summarize(cls, output_df, error_df):
+        if 'Quantity (Items)' in output_df:
+            quantity = pd.to_numeric(output_df['Quantity (Items)'], errors='coerce').fillna(0)
+            value = quantity * pd.to_numeric(output_df['Rate (Items)'], errors='coerce').fillna(0)
+            by_customer = (
+                pd.DataFrame({
+                    'Customer': output_df['Customer'],
+                    'Order': output_df['Customer\'s Purchase Order'],
+                    'Quantity': quantity,
+                    'Value': value,
+                })
+                .groupby('Customer', dropna=False)
+                .agg(Orders=('Order', 'nunique'), Quantity=('Quantity', 'sum'), Value=('Value', 'sum'))
+                .round(2)
+                .reset_index()
+            )
+            orders = output_df['Customer\'s Purchase Order'].nunique()
+        else:
+            quantity = value = pd.Series(dtype=float)
+            by_customer = pd.DataFrame()
+            orders = 0
+        errors = cls.error_categories(error_df)
+        return {
+            'metrics': {
+                'Output rows': len(output_df),
+                'Orders': int(orders),
+                'Quantity': int(quantity.sum()),
+                'Value': round(float(value.sum()), 2),
+                'Error rows': len(error_df),
+            },
+            'tables': {
+                'Totals by customer': by_customer,
+                'Errors by type': pd.DataFrame([(name, rows) for name, rows in errors.items() if rows], columns=['Error', 'Rows']),
+            },
+        }
+
+    def _process_legacy(self, dates, pack_sizes=False):
         output_rows = []
         error_rows = []
+        self.emitted_rows = np.zeros(len(self.amazon_df), dtype=bool)
 
-        for _, order in self.amazon_df.iterrows():
+        for position, (_, order) in enumerate(self.amazon_df.iterrows()):
+            if position % PROGRESS_ROWS == 0:
+                progress(min(PROGRESS_ROWS, len(self.amazon_df) - position))
             asin = order['asin']
             item_price = order['item-price']
-            amazon_quantity = int(order['quantity'])
+            amazon_quantity = int(whole_numbers([order['quantity']])[0])
 
             # Defaults
             item_code = ''
@@ -37,21 +299,29 @@ class SaleOrderTemplate:
             state = format_state(order.get('ship-state'))
             customer = f"Amazon Sales ({state})"
 
-            date_obj = datetime.fromisoformat(order['purchase-date'])
-            formatted_date = date_obj.strftime("%Y-%m-%d")
+            formatted_date = dates[position]
+            if formatted_date is None:
+                error_rows.append({
+                    'item_code': f"Error: Invalid purchase date {order['purchase-date']}",
+                    'customer': customer,
+                    'date': '',
+                    'order_id': order['amazon-order-id'],
+                    'stock_rate': str(price_per_packet),
+                    'fulfilled_by': order['fulfillment-channel']
+                })
+                continue
 
             cp_match = self.cp_df[self.cp_df['Amazon ASIN'] == asin]
             if cp_match.empty:
                 item_code_error_message = f"Error: No CP Item for ASIN {asin}"
 
                 error_rows.append({
-                    'Item Code (Items)': item_code_error_message,
-                    'Customer': customer,
-                    'Date': formatted_date,
-                    'Customer\'s Purchase Order': order['amazon-order-id'],
-                    'Customer\'s Purchase Order Date': formatted_date,
-                    'Rate of Stock UOM (Items)': str(price_per_packet),
-                    'Fulfilled By': order['fulfillment-channel']
+                    'item_code': item_code_error_message,
+                    'customer': customer,
+                    'date': formatted_date,
+                    'order_id': order['amazon-order-id'],
+                    'stock_rate': str(price_per_packet),
+                    'fulfilled_by': order['fulfillment-channel']
                 })
 
             else:
@@ -61,75 +331,177 @@ class SaleOrderTemplate:
                     item_code_error_message = f"Error: No Product Bundle for Item Code {item_code}"
 
                     error_rows.append({
-                        'Item Code (Items)': item_code_error_message,
-                        'Customer': customer,
-                        'Date': formatted_date,
-                        'Customer\'s Purchase Order': order['amazon-order-id'],
-                        'Customer\'s Purchase Order Date': formatted_date,
-                        'Rate of Stock UOM (Items)': str(price_per_packet),
-                        'Fulfilled By': order['fulfillment-channel']
+                        'item_code': item_code_error_message,
+                        'customer': customer,
+                        'date': formatted_date,
+                        'order_id': order['amazon-order-id'],
+                        'stock_rate': str(price_per_packet),
+                        'fulfilled_by': order['fulfillment-channel']
                     })
 
                 else:
-                    item_code = bundle_match.iloc[0]['Item (Product Bundle Item)']
-                    product_bundle_quantity = int(bundle_match.iloc[0]['Qty (Product Bundle Item)'])
+                    component_quantities = whole_numbers(bundle_match['Qty (Product Bundle Item)']).tolist()
+                    components = list(zip(bundle_match['Item (Product Bundle Item)'], component_quantities))
+                    item_code = components[0][0]
+                    product_bundle_quantity = sum(quantity for _, quantity in components)
 
-                    if(not product_bundle_quantity or not amazon_quantity or not bundle_quantity):
+                    if(not all(quantity for _, quantity in components) or not amazon_quantity or not bundle_quantity):
 
                         error_message = f"Error while calculating rate"
 
                         error_rows.append({
-                            'Item Code (Items)': str(item_code),
-                            'Rate (Items)': error_message,
-                            'Customer': customer,
-                            'Date': formatted_date,
-                            'Customer\'s Purchase Order': order['amazon-order-id'],
-                            'Customer\'s Purchase Order Date': formatted_date,
-                            'Rate of Stock UOM (Items)': error_message,
-                            'Fulfilled By': order['fulfillment-channel']
+                            'item_code': str(item_code),
+                            'rate': error_message,
+                            'customer': customer,
+                            'date': formatted_date,
+                            'order_id': order['amazon-order-id'],
+                            'stock_rate': error_message,
+                            'fulfilled_by': order['fulfillment-channel']
                         })
 
                     else :
+                        # One line per component; the order price is spread
+                        # evenly over every unit of every component.
                         price_per_packet = calculate_price_per_packet(
                             item_price, product_bundle_quantity, amazon_quantity
                         )
+                        self.emitted_rows[position] = True
 
-                        output_rows.append({
-                            'Item Code (Items)': str(item_code),
-                            'Quantity (Items)': str(product_bundle_quantity * amazon_quantity),
-                            'Rate (Items)': str(price_per_packet),
-                            'Customer': customer,
-                            'Date': formatted_date,
-                            'Customer\'s Purchase Order': order['amazon-order-id'],
-                            'Customer\'s Purchase Order Date': formatted_date,
-                            'Rate of Stock UOM (Items)': str(price_per_packet),
-                            'Fulfilled By': order['fulfillment-channel']
-                        })
+                        for component_code, component_quantity in components:
+                            stock_rate = price_per_packet
+                            if pack_sizes:
+                                stock_rate = calculate_price_per_packet(
+                                    item_price, product_bundle_quantity * extract_pack_of_quantity(str(component_code)),
+                                    amazon_quantity
+                                )
+
+                            output_rows.append({
+                                'item_code': str(component_code),
+                                'quantity': str(component_quantity * amazon_quantity),
+                                'rate': str(price_per_packet),
+                                'customer': customer,
+                                'date': formatted_date,
+                                'order_id': order['amazon-order-id'],
+                                'stock_rate': str(stock_rate),
+                                'fulfilled_by': order['fulfillment-channel']
+                            })
+
+        return [self.OUTPUT_SCHEMA.from_records(output_rows), self.OUTPUT_SCHEMA.from_records(error_rows)]
+
+    def _process_vectorized(self, dates, invalid_dates, pack_sizes=False):
+        orders = self.amazon_df
+        amazon_quantity = whole_numbers(orders['quantity'])
+        item_price = orders['item-price'].to_numpy()
+        order_ids = orders['amazon-order-id'].to_numpy(dtype=object)
+        fulfilled_by = orders['fulfillment-channel'].to_numpy(dtype=object)
+        asins = orders['asin'].to_numpy(dtype=object)
+
+        states = map_unique(orders['ship-state'], format_state)
+        customers = np.array([f"Amazon Sales ({state})" for state in states], dtype=object)
+
+        with stage('lookup'):
+            # ASIN -> Item Code as a hash join, then Item Code -> every bundle
+            # component as a one-to-many join, one row per (order, component)
+            # in bundle file order.
+            has_cp, cp_values = lookup_first(asins, self.cp_df, 'Amazon ASIN', ['Item Code'])
+            item_codes = np.empty(len(orders), dtype=object)
+            item_codes[has_cp] = cp_values['Item Code']
+
+            cp_rows = np.flatnonzero(has_cp)
+            bundles = self.bundle_df.dropna(subset=['ID'])
+            components = pd.DataFrame({'order': cp_rows, 'ID': item_codes[cp_rows]}).merge(
+                pd.DataFrame({
+                    'ID': bundles['ID'].to_numpy(dtype=object),
+                    'component': np.arange(len(bundles)),
+                    'code': bundles['Item (Product Bundle Item)'].to_numpy(dtype=object),
+                    'quantity': bundles['Qty (Product Bundle Item)'].to_numpy(),
+                }),
+                on='ID', how='inner', sort=False,
+            ).sort_values(['order', 'component'], kind='stable')
+            component_order = components['order'].to_numpy()
+            component_codes = components['code'].to_numpy(dtype=object)
+            component_quantity = whole_numbers(components['quantity'])
+
+            has_bundle = np.zeros(len(orders), dtype=bool)
+            has_bundle[component_order] = True
+            first = np.r_[True, component_order[1:] != component_order[:-1]] if len(component_order) else np.zeros(0, bool)
+            item_codes[component_order[first]] = component_codes[first]
+            bundle_quantity = np.bincount(component_order, weights=component_quantity, minlength=len(orders)).astype(np.int64)
+            zero_component = np.bincount(component_order, weights=component_quantity == 0, minlength=len(orders)) > 0
+
+        dated = ~invalid_dates
+        valid = dated & has_bundle & ~zero_component & (bundle_quantity != 0) & (amazon_quantity != 0)
+        missing_cp = dated & ~has_cp
+        missing_bundle = dated & has_cp & ~has_bundle
+        bad_rate = dated & has_bundle & ~valid
+        self.emitted_rows = valid
+
+        if tracing():
+            trace(pd.DataFrame({
+                'Order': order_ids,
+                'ASIN': asins,
+                'Item Code': item_codes,
+                'Outcome': np.select(
+                    [invalid_dates, missing_cp, missing_bundle, bad_rate],
+                    ['invalid date', 'no CP item', 'no product bundle', 'rate'], 'ok'
+                ),
+            }).to_dict('records'))
+
+        progress(len(orders))
+        # The order price is spread evenly over every unit of every component.
+        lines = valid[component_order]
+        line_order = component_order[lines]
+        line_codes = component_codes[lines]
+        units = bundle_quantity[line_order] * amazon_quantity[line_order]
+        quantity = component_quantity[lines] * amazon_quantity[line_order]
+        rates = [str(round(price, 2)) for price in (item_price[line_order] / units).tolist()]
+        if pack_sizes:
+            stock_rates = [
+                str(round(price, 2)) for price in (item_price[line_order] / (units * pack_of_quantities(line_codes))).tolist()
+            ]
+        else:
+            stock_rates = rates
+
+        output_df = self.OUTPUT_SCHEMA.build({
+            'item_code': [str(code) for code in line_codes],
+            'quantity': [str(value) for value in quantity.tolist()],
+            'rate': rates,
+            'customer': customers[line_order].tolist(),
+            'date': dates[line_order].tolist(),
+            'order_id': order_ids[line_order].tolist(),
+            'stock_rate': stock_rates,
+            'fulfilled_by': fulfilled_by[line_order].tolist()
+        } if lines.any() else {})
+
+        error_df = self._build_error_frame(
+            invalid_dates, missing_cp, missing_bundle, bad_rate,
+            orders['purchase-date'].to_numpy(dtype=object), asins, item_codes, customers, dates, order_ids, fulfilled_by
+        )
+        return [output_df, error_df]
+
+    def _build_error_frame(self, invalid_dates, missing_cp, missing_bundle, bad_rate, purchase_dates, asins, item_codes,
+                           customers, dates, order_ids, fulfilled_by):
+        errors = invalid_dates | missing_cp | missing_bundle | bad_rate
+        if not errors.any():
+            return self.OUTPUT_SCHEMA.build({})
+
+        error_message = "Error while calculating rate"
+        item_column = np.empty(len(errors), dtype=object)
+        item_column[invalid_dates] = [f"Error: Invalid purchase date {value}" for value in purchase_dates[invalid_dates]]
+        item_column[missing_cp] = [f"Error: No CP Item for ASIN {asin}" for asin in asins[missing_cp]]
+        item_column[missing_bundle] = [f"Error: No Product Bundle for Item Code {code}" for code in item_codes[missing_bundle]]
+        item_column[bad_rate] = [str(code) for code in item_codes[bad_rate]]
+        rate_column = np.where(bad_rate, error_message, '')
 
-        output_df = pd.DataFrame(output_rows)
-        error_rows = pd.DataFrame(error_rows)
-        return [self.add_default_columns(output_df), self.add_default_columns(error_rows)]
-
-
-
-    def add_default_columns(self, df):
-        df['Company'] = ''
-        df['Cost Center'] = '6 - Retail - TMPL'
-        df['Currency'] = 'INR'
-        df['Order Type'] = 'Shopping Cart'
-        df['Price List'] = 'Standard Selling'
-        df['Status'] = 'Draft'
-        df['Price List Exchange Rate'] = '1'
-        df['Exchange Rate'] = '1'
-        df['Cost Center (Items)'] = '6 - Retail - TMPL'
-        df['Price List Currency'] = 'INR'
-        df['Series'] = 'SAL-ORD-.YYYY.-'
-        df['Company Address'] = ''
-        df['Company Address Name'] = ''
-        df['Payment Terms Template'] = '7DINVOICE_LOCAL'
-        df['Sales Taxes and Charges Template'] = ''
-        df['Set Source Warehouse'] = ''
-        df['UOM (Items)'] = 'Nos'
-        df['Delivery Date (Items)'] = ''
-        df['Delivery Warehouse (Items)'] = ''
-        return df
\ No newline at end of file
+        error_dates = np.where(invalid_dates, '', dates)[errors].tolist()
+        fields = {
+            'item_code': item_column[errors].tolist(),
+            'customer': customers[errors].tolist(),
+            'date': error_dates,
+            'order_id': order_ids[errors].tolist(),
+            'stock_rate': rate_column[errors].tolist(),
+            'fulfilled_by': fulfilled_by[errors].tolist()
+        }
+        if bad_rate.any():
+            fields['rate'] = [error_message if flag else np.nan for flag in bad_rate[errors]]
+        return self.OUTPUT_SCHEMA.build(fields)
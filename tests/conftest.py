@@ -0,0 +1,18 @@
+import pytest
+
+from helpers.cache import PARSED_FRAMES
+from helpers.conversion_cache import CONVERTED
+
+
+@pytest.fixture(autouse=True)
+def conversion_cache(tmp_path):
+    # Converted files go to the test's own directory instead of the working
+    # tree's .conversion_cache, and no test sees another one's parsed frames.
+    PARSED_FRAMES.clear()
+    if CONVERTED is None:
+        yield None
+        return
+    directory = CONVERTED.directory
+    CONVERTED.directory = str(tmp_path / "conversion_cache")
+    yield CONVERTED
+    CONVERTED.directory = directory
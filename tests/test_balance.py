@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from helpers.batch import SOURCE_COLUMN
+from templates.PaymentStatementTemplate import PaymentStatementTemplate
+
+
+def journal(*entries):
+    # Entries as (reference, [(account, debit, credit), ...]); the first line
+    # of each carries the Entry Type.
+    rows = []
+    for reference, lines in entries:
+        for line, (account, debit, credit) in enumerate(lines):
+            rows.append({
+                "Entry Type": "Journal Entry" if line == 0 else np.nan,
+                "Reference Number": reference if line == 0 else np.nan,
+                "Account (Accounting Entries)": account,
+                "Debit (Accounting Entries)": debit,
+                "Credit (Accounting Entries)": credit,
+            })
+    return pd.DataFrame(rows)
+
+
+def test_balanced_entries_have_no_issues():
+    output_df = journal(
+        ("171-1", [("Debtors (INR) - TMPL", 0.0, 500.0), ("1604 - Amazon COD Fund - TMPL", 499.99, 0.0),
+                   ("Rounded Off - TMPL", 0.01, 0.0)]),
+        ("171-2", [("Debtors (INR) - TMPL", 0.0, 300.0), ("1604 - Amazon COD Fund - TMPL", 300.0, 0.0)]),
+    )
+    assert PaymentStatementTemplate.balance_issues(output_df).empty
+
+
+def test_unbalanced_entry():
+    output_df = journal(
+        ("171-1", [("Debtors (INR) - TMPL", 0.0, 500.0), ("1604 - Amazon COD Fund - TMPL", 500.0, 0.0)]),
+        ("171-2", [("Debtors (INR) - TMPL", 0.0, 300.0), ("1604 - Amazon COD Fund - TMPL", 290.0, 0.0)]),
+    )
+    issues = PaymentStatementTemplate.balance_issues(output_df)
+
+    assert issues[["Entry", "First Row", "Reference Number", "Difference", "Issue"]].values.tolist() == [
+        [2, 2, "171-2", -10.0, "unbalanced"],
+    ]
+
+
+def test_blank_account():
+    output_df = journal(("171-1", [("Debtors (INR) - TMPL", 0.0, 500.0), (" ", 500.0, 0.0)]))
+    issues = PaymentStatementTemplate.balance_issues(output_df)
+
+    assert issues[["Lines Without Account", "Issue"]].values.tolist() == [[1, "empty account"]]
+
+
+def test_entries_do_not_cross_source_files():
+    # The second file's lines continue no entry of the first, though they
+    # carry no Entry Type; each side is checked on its own.
+    first = journal(("171-1", [("Debtors (INR) - TMPL", 0.0, 500.0), ("1604 - Amazon COD Fund - TMPL", 400.0, 0.0)]))
+    second = journal(("171-2", [("Debtors (INR) - TMPL", 0.0, 100.0), ("1604 - Amazon COD Fund - TMPL", 200.0, 0.0)])).iloc[1:]
+    output_df = pd.concat([first.assign(**{SOURCE_COLUMN: "a.xlsx"}), second.assign(**{SOURCE_COLUMN: "b.xlsx"})],
+                          ignore_index=True)
+    issues = PaymentStatementTemplate.balance_issues(output_df)
+
+    assert issues[[SOURCE_COLUMN, "First Row", "Difference", "Issue"]].values.tolist() == [
+        ["a.xlsx", 0, -100.0, "unbalanced"],
+        ["b.xlsx", 2, 200.0, "unbalanced, no entry type"],
+    ]
+
+
+def test_journal_without_entry_type_column():
+    output_df = journal(
+        ("171-1", [("Debtors (INR) - TMPL", 0.0, 500.0), ("1604 - Amazon COD Fund - TMPL", 500.0, 0.0)]),
+    ).drop(columns=["Entry Type", "Reference Number"])
+    issues = PaymentStatementTemplate.balance_issues(output_df)
+
+    assert issues[["Entry", "Lines", "Issue"]].values.tolist() == [[1, 2, "no entry type"]]
@@ -0,0 +1,52 @@
+import os
+
+import pandas as pd
+import pytest
+
+from helpers.cache import PARSED_FRAMES
+from helpers.conversion_cache import HAS_ARROW, ConversionCache
+from helpers.file_handler import FileHandler
+
+pytestmark = pytest.mark.skipif(not HAS_ARROW, reason="the conversion cache needs pyarrow")
+
+
+def test_round_trip_and_column_selection(tmp_path):
+    cache = ConversionCache(str(tmp_path), 1024 * 1024)
+    df = pd.DataFrame({"order-id": ["171-1", None], "amount": [10.5, -2.0]})
+
+    assert cache.get("statement") is None
+    assert cache.put("statement", df)
+    pd.testing.assert_frame_equal(cache.get("statement"), df)
+    pd.testing.assert_frame_equal(cache.get("statement", ["amount"]), df[["amount"]])
+
+
+def test_mixed_columns_are_not_cached(tmp_path):
+    cache = ConversionCache(str(tmp_path), 1024 * 1024)
+
+    assert not cache.put("mixed", pd.DataFrame({"quantity": [1, "two"]}))
+    assert cache.get("mixed") is None
+
+
+def test_least_recently_read_files_are_evicted(tmp_path):
+    df = pd.DataFrame({"amount": range(1000)})
+    cache = ConversionCache(str(tmp_path), 1024 * 1024)
+    cache.put("old", df)
+    cache.max_bytes = os.path.getsize(cache.path("old")) * 3 // 2
+    os.utime(cache.path("old"), (0, 0))
+    cache.put("new", df)
+
+    assert cache.get("old") is None
+    assert cache.get("new") is not None
+
+
+def test_reads_come_from_the_converted_file(tmp_path, conversion_cache, monkeypatch):
+    path = tmp_path / "statement.xlsx"
+    pd.DataFrame({"order-id": ["171-1", "171-2"], "amount": [10.5, -2.0]}).to_excel(path, index=False)
+    read = {"file": str(path), "required_columns": ["order-id", "amount"], "dtypes": {"order-id": str}}
+    parsed = FileHandler.read_columns(**read)
+    key = FileHandler.cache_key(read["file"], read["required_columns"], dtypes=read["dtypes"])
+
+    assert os.path.exists(conversion_cache.path(key))
+    PARSED_FRAMES.clear()
+    monkeypatch.setattr(FileHandler, "_read_columns", lambda *args: pytest.fail("the workbook was parsed again"))
+    pd.testing.assert_frame_equal(FileHandler.read_columns(**read), parsed)
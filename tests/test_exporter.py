@@ -0,0 +1,76 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers import exporter
+from helpers.exporter import open_sink, write_xlsx
+
+COLUMNS = ["Account", "Debit", "Credit"]
+
+
+def read_back(path, export_format):
+    if export_format == "csv":
+        return pd.read_csv(path)
+    return pd.read_excel(path)
+
+
+def chunks():
+    return [
+        pd.DataFrame({"Account": ["Debtors", "Fund"], "Debit": [0.0, 500.0], "Credit": [500.0, 0.0]}),
+        pd.DataFrame({"Credit": [20.5], "Account": ["Creditors"]}),
+    ]
+
+
+def test_write_xlsx_round_trip():
+    sheets = [("Output", chunks()[0]), ("Errors", pd.DataFrame({"Account": ["Error: No match", np.nan], "Credit": [np.nan, 12.5]}))]
+    workbook = pd.read_excel(io.BytesIO(write_xlsx(sheets)), sheet_name=None)
+
+    assert list(workbook) == ["Output", "Errors"]
+    for name, df in sheets:
+        pd.testing.assert_frame_equal(workbook[name], df, check_dtype=False)
+
+
+def test_write_xlsx_refuses_sheets_past_the_row_limit(monkeypatch):
+    monkeypatch.setattr(exporter, "XLSX_MAX_ROWS", 3)
+    write_xlsx([("Output", pd.DataFrame({"Account": ["a", "b"]}))])
+    with pytest.raises(ValueError, match="export it as CSV"):
+        write_xlsx([("Output", pd.DataFrame({"Account": ["a", "b", "c"]}))])
+
+
+@pytest.mark.parametrize("export_format", ["csv", "xlsx"])
+def test_sink_round_trip(export_format, tmp_path):
+    path = str(tmp_path / f"output.{export_format}")
+    with open_sink(path, COLUMNS, export_format) as sink:
+        for chunk in chunks():
+            sink.write(chunk)
+        sink.write(pd.DataFrame(columns=COLUMNS))
+
+    assert sink.rows == 3
+    expected = pd.concat([chunk.reindex(columns=COLUMNS) for chunk in chunks()], ignore_index=True)
+    pd.testing.assert_frame_equal(read_back(path, export_format), expected)
+
+
+@pytest.mark.parametrize("export_format", ["csv", "xlsx"])
+def test_empty_sinks(export_format, tmp_path):
+    kept, dropped = (str(tmp_path / f"{name}.{export_format}") for name in ("kept", "dropped"))
+    with open_sink(kept, COLUMNS, export_format):
+        pass
+    with open_sink(dropped, COLUMNS, export_format, keep_empty=False):
+        pass
+
+    assert list(read_back(kept, export_format).columns) == COLUMNS
+    assert not (tmp_path / f"dropped.{export_format}").exists()
+
+
+def test_xlsx_sink_refuses_rows_past_the_limit_and_leaves_no_file(monkeypatch, tmp_path):
+    monkeypatch.setattr(exporter, "XLSX_MAX_ROWS", 3)
+    path = tmp_path / "output.xlsx"
+    with pytest.raises(ValueError, match="export it as CSV"):
+        with open_sink(str(path), COLUMNS) as sink:
+            for chunk in chunks():
+                sink.write(chunk)
+
+    assert sink.rows == 2
+    assert not path.exists()
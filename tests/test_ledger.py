@@ -0,0 +1,103 @@
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.run import TEMPLATES
+from benchmarks.synthetic import write_inputs
+from helpers.batch import SOURCE_COLUMN, process_files, record_pending
+from helpers.ledger import ProcessedLedger
+from templates.PaymentStatementTemplate import PaymentStatementTemplate
+from templates.SaleOrderTemplate import SaleOrderTemplate
+
+PAYMENT_KWARGS = {"order_type": "COD_", "expense": "Promo rebates,Product tax discount"}
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = ProcessedLedger(str(tmp_path / "ledger.sqlite"))
+    yield ledger
+    ledger.close()
+
+
+def upload(kind, directory):
+    template_class, _, process_kwargs = TEMPLATES[kind]
+    input_path, *reference_paths = write_inputs(kind, 300, str(directory))
+    return template_class.from_reference(*reference_paths), input_path, process_kwargs
+
+
+@pytest.mark.parametrize("kind", ["sale_order", "payment_statement"])
+def test_app_runs_record_nothing_until_the_output_is_kept(kind, tmp_path, ledger):
+    reference, path, process_kwargs = upload(kind, tmp_path)
+    output_df, error_df, _, _, pending = process_files(reference, [path], process_kwargs, ledger=ledger)
+
+    assert ledger.size(reference.LEDGER_KIND) == 0
+    rerun = process_files(reference, [path], process_kwargs, ledger=ledger)
+    pd.testing.assert_frame_equal(rerun[0], output_df)
+
+    record_pending(ledger, reference.LEDGER_KIND, pending)
+    assert ledger.size(reference.LEDGER_KIND) > 0
+    assert process_files(reference, [path], process_kwargs, ledger=ledger)[0].empty
+
+
+@pytest.mark.parametrize("kind", ["sale_order", "payment_statement"])
+def test_rows_in_two_files_of_one_upload_come_out_once(kind, tmp_path, ledger):
+    reference, path, process_kwargs = upload(kind, tmp_path)
+    copy = str(tmp_path / "copy.xlsx")
+    shutil.copy(path, copy)
+    single = process_files(reference, [path], process_kwargs, ledger=ledger)[0]
+    output_df, _, status_df, _, _ = process_files(reference, [path, copy], process_kwargs, ledger=ledger)
+
+    assert (output_df[SOURCE_COLUMN] == single[SOURCE_COLUMN].iloc[0]).all()
+    pd.testing.assert_frame_equal(output_df, single)
+    assert status_df["Output Rows"].tolist() == [len(single), 0]
+
+
+def test_sale_order_rows_that_errored_are_tried_again(ledger):
+    amazon_df = pd.DataFrame([{
+        "asin": asin, "item-price": 200.0, "quantity": 1, "ship-state": "MAHARASHTRA",
+        "purchase-date": "2024-01-05T10:00:00+00:00", "amazon-order-id": "171-0000001-0000001",
+    } for asin in ("B000000001", "B000000002")])
+    bundle_df = pd.DataFrame({
+        "ID": ["ITEM-1", "ITEM-2"], "Item (Product Bundle Item)": ["ITEM-1", "ITEM-2"], "Qty (Product Bundle Item)": [1, 1],
+    })
+
+    def run(cp_df):
+        template = SaleOrderTemplate.from_frames(amazon_df, cp_df, bundle_df).new_only(ledger)
+        output_df, error_df = template.process()
+        template.record_processed(ledger)
+        return output_df
+
+    listed = pd.DataFrame({"Amazon ASIN": ["B000000001"], "Item Code": ["ITEM-1"]})
+    assert run(listed)["Item Code (Items)"].tolist() == ["ITEM-1"]
+    listed = pd.DataFrame({"Amazon ASIN": ["B000000001", "B000000002"], "Item Code": ["ITEM-1", "ITEM-2"]})
+    assert run(listed)["Item Code (Items)"].tolist() == ["ITEM-2"]
+    assert run(listed).empty
+
+
+def test_repeated_identical_statement_lines(ledger):
+    advertising = {
+        "order-id": np.nan, "amount": -10.0, "posted-date": "05.01.2024",
+        "amount-description": "Cost of Advertising", "amount-type": "Cost of Advertising",
+    }
+    header = {"settlement-start-date": "01.01.2024 00:00:00 UTC", "settlement-end-date": "15.01.2024 00:00:00 UTC", "amount": 0.0}
+    sale_register = pd.DataFrame([{
+        "Customer's Purchase Order": "171-0000001-0000001", "Company GSTIN": "27AACCT1557E1ZH",
+        "Customer Name": "Amazon Sales (Maharashtra)", "Voucher": "SINV-1", "Voucher Type": "Sales Invoice",
+        "Posting Date": pd.Timestamp(2024, 1, 5), "Cost Center": "6 - Retail - TMPL",
+        "Company": "Thakker Mercantile Private Limited",
+    }])
+    matching_template = pd.DataFrame(columns=sorted(PaymentStatementTemplate.REQUIRED_MATCHING_TEMPLATE_COLUMNS))
+    reference = PaymentStatementTemplate.from_frames(None, sale_register, matching_template)
+
+    def run(lines):
+        statement = pd.DataFrame([header] + [advertising] * lines, columns=sorted(reference.REQUIRED_PAYMENT_COLUMNS))
+        template = reference.with_input(statement).new_only(ledger)
+        output_df, error_df = template.process(**PAYMENT_KWARGS)
+        template.record_processed(ledger)
+        return output_df
+
+    assert len(run(1))
+    assert len(run(2))
+    assert run(2).empty
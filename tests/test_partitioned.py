@@ -0,0 +1,23 @@
+import pytest
+
+from benchmarks.synthetic import payment_statement_inputs
+from helpers import batch
+from templates.PaymentStatementTemplate import PaymentStatementTemplate
+
+
+@pytest.mark.parametrize("order_type", ["COD_", "Electronic_"])
+@pytest.mark.parametrize("partitions", [2, 3])
+def test_partitioned_engine_matches_groupby(order_type, partitions, monkeypatch):
+    # The partitions run on the partition pool, in fork server processes.
+    monkeypatch.setattr(PaymentStatementTemplate, "PARTITION_ROWS", 500)
+    monkeypatch.setattr(batch, "PARTITION_WORKERS", partitions)
+    payment_statement, sale_register, matching_template = payment_statement_inputs(3000, seed=5)
+    payment_statement.loc[7, "posted-date"] = "not a date"
+    template = PaymentStatementTemplate.from_frames(payment_statement, sale_register, matching_template)
+    process_kwargs = {"order_type": order_type, "expense": "Promo rebates,Product tax discount"}
+
+    expected = template.process(**process_kwargs)
+    actual = template.process(**process_kwargs, engine="partitioned")
+
+    for expected_df, actual_df in zip(expected, actual):
+        assert actual_df.to_csv(index=False) == expected_df.to_csv(index=False)
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from templates.PaymentStatementTemplate import PaymentStatementTemplate
+
+PAYMENT_KWARGS = {"order_type": "COD_", "expense": "Promo rebates,Product tax discount"}
+
+
+def statement(lines):
+    rows = [{
+        "settlement-start-date": "01.01.2024 00:00:00 UTC", "settlement-end-date": "15.01.2024 00:00:00 UTC",
+        "order-id": np.nan, "amount": 1000.0, "posted-date": np.nan, "amount-description": np.nan, "amount-type": np.nan,
+    }]
+    for order_id, amount_type, description, amount in lines:
+        rows.append({
+            "order-id": order_id, "amount": amount, "posted-date": "05.01.2024",
+            "amount-description": description, "amount-type": amount_type,
+        })
+    return pd.DataFrame(rows)
+
+
+def payment_template():
+    sale_register = pd.DataFrame([{
+        "Customer's Purchase Order": order_id, "Company GSTIN": "27AACCT1557E1ZH",
+        "Customer Name": "Amazon Sales (Maharashtra)", "Voucher": f"SINV-{number}", "Voucher Type": "Sales Invoice",
+        "Posting Date": pd.Timestamp(2024, 1, 5), "Cost Center": "6 - Retail - TMPL",
+        "Company": "Thakker Mercantile Private Limited",
+    } for number, order_id in enumerate(["171-0000001-0000001", "171-0000002-0000002"])])
+    matching_template = pd.DataFrame([
+        {"amount-description": "Principal", "ERP 27 Company": "Debtors (INR) - TMPL", "ERP 29 Company": "Debtors (INR) - TMPL29"},
+        {"amount-description": "Commission", "ERP 27 Company": "Creditors (INR) - TMPL", "ERP 29 Company": "Creditors (INR) - TMPL29"},
+    ])
+    return PaymentStatementTemplate.from_frames(None, sale_register, matching_template)
+
+
+def both_engines(template, **kwargs):
+    candidate = template.process(**kwargs)
+    reference = template.process(**kwargs, engine="legacy")
+    for expected, actual in zip(reference, candidate):
+        pd.testing.assert_frame_equal(expected, actual)
+    return candidate
+
+
+def test_order_without_principal_line_is_an_error():
+    template = payment_template().with_input(statement([
+        ("171-0000001-0000001", "ItemPrice", "Principal", 500.0),
+        ("171-0000001-0000001", "ItemFees", "Commission", -20.0),
+        ("171-0000002-0000002", "ItemFees", "Commission", -30.0),
+    ]))
+    output_df, error_df = both_engines(template, **PAYMENT_KWARGS)
+
+    assert (error_df["Reference Number"] == PaymentStatementTemplate.NO_PRINCIPAL_ERROR + "171-0000002-0000002").any()
+    assert not output_df["Account (Accounting Entries)"].isna().any()
+    assert not (output_df["Account (Accounting Entries)"] == "").any()
+    assert not PaymentStatementTemplate.order_mask(output_df, "171-0000002-0000002").any()
+
+
+def test_last_line_without_matching_template_entry():
+    template = payment_template().with_input(statement([
+        ("171-0000001-0000001", "ItemPrice", "Principal", 500.0),
+        ("171-0000001-0000001", "ItemFees", "Unknown fee", -20.0),
+        ("171-0000002-0000002", "ItemPrice", "Principal", 300.0),
+        ("171-0000002-0000002", "ItemFees", "Unknown fee", -10.0),
+    ]))
+    output_df, error_df = both_engines(template, **PAYMENT_KWARGS)
+
+    assert (error_df["Account (Accounting Entries)"] == "Error: No match for Unknown fee").sum() == 2
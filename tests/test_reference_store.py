@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+
+from helpers.cache import content_hash
+from helpers.exporter import write_xlsx
+from helpers.reference_store import ReferenceStore
+from templates.PaymentStatementTemplate import PaymentStatementTemplate
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReferenceStore(str(tmp_path / "reference.sqlite"))
+    yield store
+    store.close()
+
+
+def matching_template(account):
+    return pd.DataFrame({
+        "amount-description": ["Principal", "Commission"],
+        "ERP 27 Company": [account, None],
+        "ERP 29 Company": ["Debtors (INR) - TMPL29", "Creditors (INR) - TMPL29"],
+    })
+
+
+@pytest.mark.parametrize("infer_string", [True, False])
+def test_nulls_are_loaded_as_missing_values(store, infer_string):
+    # Without string inference, str is object dtype, as before pandas 3.
+    store.put("matching_template", matching_template("Debtors (INR) - TMPL"), "v1")
+    with pd.option_context("future.infer_string", infer_string):
+        df = store.load("matching_template", dtypes=PaymentStatementTemplate.MATCHING_TEMPLATE_DTYPES)
+
+    assert df["ERP 27 Company"].tolist()[0] == "Debtors (INR) - TMPL"
+    assert df["ERP 27 Company"].isna().tolist() == [False, True]
+
+
+def test_storing_a_version_does_not_make_it_current(store):
+    store.put("matching_template", matching_template("first"), "v1")
+    store.put("matching_template", matching_template("second"), "v2")
+
+    assert store.current_version("matching_template") == "v1"
+    assert store.load("matching_template")["ERP 27 Company"][0] == "first"
+    assert store.load("matching_template", "v2")["ERP 27 Company"][0] == "second"
+
+    store.set_current("matching_template", "v2")
+    assert store.load("matching_template")["ERP 27 Company"][0] == "second"
+    with pytest.raises(ValueError):
+        store.set_current("matching_template", "v3")
+
+
+def test_an_upload_is_used_without_changing_the_stored_one(store, tmp_path):
+    paths = []
+    for account in ("stored", "uploaded"):
+        paths.append(tmp_path / f"{account}.xlsx")
+        paths[-1].write_bytes(write_xlsx([("Sheet1", matching_template(account))]))
+    sale_register = tmp_path / "sale_register.xlsx"
+    sale_register.write_bytes(write_xlsx([("Sheet1", pd.DataFrame(
+        columns=sorted(PaymentStatementTemplate.REQUIRED_SALE_REGISTER_COLUMNS)
+    ))]))
+    stored, uploaded = (str(path) for path in paths)
+
+    PaymentStatementTemplate.from_reference(str(sale_register), stored, store=store)
+    template = PaymentStatementTemplate.from_reference(str(sale_register), uploaded, store=store)
+    assert template.matching_template["ERP 27 Company"][0] == "uploaded"
+    assert store.current_version("matching_template") == content_hash(stored)
+
+    template = PaymentStatementTemplate.from_reference(str(sale_register), store=store)
+    assert template.matching_template["ERP 27 Company"][0] == "stored"
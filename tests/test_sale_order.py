@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+
+from templates.SaleOrderTemplate import SaleOrderTemplate
+
+
+def order(**values):
+    return {
+        "asin": "B000000001", "item-price": 200.0, "quantity": 1, "ship-state": "MAHARASHTRA",
+        "purchase-date": "2024-01-05T10:00:00+00:00", "amazon-order-id": "171-0000001-0000001", **values,
+    }
+
+
+def both_engines(template, **kwargs):
+    candidate = template.process(**kwargs)
+    reference = template.process(**kwargs, engine="legacy")
+    for expected, actual in zip(reference, candidate):
+        pd.testing.assert_frame_equal(expected, actual)
+    return candidate
+
+
+def test_blank_bundle_quantity_is_a_rate_error():
+    cp_df = pd.DataFrame([{"Amazon ASIN": "B000000001", "Item Code": "BUNDLE-1"}])
+    bundle_df = pd.DataFrame([
+        {"ID": "BUNDLE-1", "Item (Product Bundle Item)": "ITEM-1", "Qty (Product Bundle Item)": 2},
+        {"ID": "BUNDLE-1", "Item (Product Bundle Item)": "ITEM-2", "Qty (Product Bundle Item)": np.nan},
+    ])
+    template = SaleOrderTemplate.from_frames(pd.DataFrame([order()]), cp_df, bundle_df)
+    output_df, error_df = both_engines(template)
+
+    assert output_df.empty
+    assert SaleOrderTemplate.error_categories(error_df)["rate"] == 1
+
+
+def test_blank_or_fractional_order_quantity_is_a_rate_error():
+    cp_df = pd.DataFrame([{"Amazon ASIN": "B000000001", "Item Code": "ITEM-1"}])
+    bundle_df = pd.DataFrame([{"ID": "ITEM-1", "Item (Product Bundle Item)": "ITEM-1", "Qty (Product Bundle Item)": 1}])
+    amazon_df = pd.DataFrame([order(quantity=quantity) for quantity in (np.nan, 1.5, 2)])
+    output_df, error_df = both_engines(SaleOrderTemplate.from_frames(amazon_df, cp_df, bundle_df))
+
+    assert output_df["Quantity (Items)"].astype(int).tolist() == [2]
+    assert SaleOrderTemplate.error_categories(error_df)["rate"] == 2
+
+
+def test_missing_fulfillment_channel_is_left_blank():
+    cp_df = pd.DataFrame([{"Amazon ASIN": "B000000001", "Item Code": "ITEM-1"}])
+    bundle_df = pd.DataFrame([{"ID": "ITEM-1", "Item (Product Bundle Item)": "ITEM-1", "Qty (Product Bundle Item)": 1}])
+    output_df, _ = both_engines(SaleOrderTemplate.from_frames(pd.DataFrame([order()]), cp_df, bundle_df))
+
+    assert output_df["Fulfilled By"].tolist() == [""]
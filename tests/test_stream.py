@@ -0,0 +1,51 @@
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import payment_statement_inputs
+from helpers.batch import _stream
+from helpers.exporter import write_csv
+from templates.PaymentStatementTemplate import PaymentStatementTemplate
+
+PAYMENT_KWARGS = {"order_type": "COD_", "expense": "Promo rebates,Product tax discount"}
+
+
+@pytest.fixture(scope="module")
+def statement():
+    payment_statement, sale_register, matching_template = payment_statement_inputs(3000, seed=3)
+    payment_statement.loc[5, "posted-date"] = "not a date"
+    return payment_statement, PaymentStatementTemplate.from_frames(None, sale_register, matching_template)
+
+
+def test_statement_has_null_order_and_reserve_lines(statement):
+    payment_statement, _ = statement
+    descriptions = set(payment_statement.loc[payment_statement["order-id"].isna(), "amount-description"].dropna())
+    assert {"Cost of Advertising", *PaymentStatementTemplate.RESERVE_DESCRIPTIONS} <= descriptions
+
+
+@pytest.mark.parametrize("chunk_rows", [100, 1000, 50000])
+def test_stream_chunks_make_up_the_processed_journal(statement, chunk_rows):
+    payment_statement, reference = statement
+    template = reference.with_input(payment_statement)
+    output_df, error_df = template.process(**PAYMENT_KWARGS)
+    chunks = list(template.stream(**PAYMENT_KWARGS, chunk_rows=chunk_rows))
+
+    for expected, frames in ((output_df, [output for output, _ in chunks]), (error_df, [errors for _, errors in chunks])):
+        streamed = pd.concat([frame for frame in frames if len(frame)], ignore_index=True)
+        assert set(streamed.columns) == set(expected.columns)
+        assert streamed[expected.columns].to_csv(index=False) == expected.to_csv(index=False)
+
+
+def test_streamed_files_match_the_processed_journal(statement, tmp_path, monkeypatch):
+    payment_statement, reference = statement
+    output_df, error_df = reference.with_input(payment_statement).process(**PAYMENT_KWARGS)
+    monkeypatch.setattr(PaymentStatementTemplate, "STREAM_ROWS", 500)
+    _stream(reference, payment_statement, PAYMENT_KWARGS, None, "statement.xlsx", str(tmp_path), "csv")
+
+    for suffix, expected in (("output", output_df), ("errors", error_df)):
+        with open(os.path.join(tmp_path, f"statement_{suffix}.csv"), "rb") as file:
+            written = pd.read_csv(file, dtype=str, keep_default_na=False)
+        expected = pd.read_csv(io.BytesIO(write_csv(expected)), dtype=str, keep_default_na=False)
+        pd.testing.assert_frame_equal(written[expected.columns], expected)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import sale_order_inputs
+from benchmarks.verify import verify_case
+from helpers.batch import _process
+from helpers.ledger import ProcessedLedger
+from templates.SaleOrderTemplate import SaleOrderTemplate
+
+
+@pytest.mark.parametrize("kind", ["sale_order", "payment_statement"])
+def test_engines_agree_on_synthetic_inputs(kind, tmp_path):
+    result = verify_case(kind, 1000, str(tmp_path))
+    assert result.ok, result.report()
+
+
+def test_shadow_runs_record_the_candidate_rows(tmp_path, monkeypatch):
+    # A legacy engine that emits nothing disagrees on every row; the ledger
+    # must still get the rows of the output that is kept, the candidate's.
+    def emits_nothing(self, dates, pack_sizes=False):
+        self.emitted_rows = np.zeros(len(self.amazon_df), dtype=bool)
+        return [self.OUTPUT_SCHEMA.build({}), self.OUTPUT_SCHEMA.build({})]
+
+    monkeypatch.setattr(SaleOrderTemplate, "_process_legacy", emits_nothing)
+    amazon_df, cp_df, bundle_df = sale_order_inputs(300)
+    reference = SaleOrderTemplate.from_frames(None, cp_df, bundle_df)
+    ledger = ProcessedLedger(str(tmp_path / "ledger.sqlite"))
+
+    template, output_df, error_df = _process(reference, amazon_df, {}, ledger, "shadow", shadow=True)
+    keys = template.processed_keys()
+
+    assert len(output_df)
+    assert {key.split("|")[0] for key in keys} == set(output_df["Customer's Purchase Order"])
+    assert template.record_processed(ledger) == len(keys)
+    ledger.close()